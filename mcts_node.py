@@ -1,3 +1,6 @@
+import sys
+from array import array
+from multiprocessing import shared_memory
 
 
 class MCTSNode:
@@ -43,3 +46,267 @@ class MCTSNode:
             for child in self.child_nodes.values():
                 string += child.tree_to_string(horizon - 1, indent + 1)
         return string
+
+
+class TranspositionTable:
+    def __init__(self, size):
+        """ Maps position hashes to the tree node (an MCTSNode or a NodePool index) holding their statistics, so
+        that a position reached by different move orders is searched once. At most size positions are kept; when
+        the table is full the oldest entry is dropped, which only stops later transpositions of it from being
+        shared.
+
+        Args:
+            size:   The maximum number of positions to keep.
+
+        """
+        self.size = size
+        self.nodes = {}                         # Hash -> MCTSNode dictionary, oldest first
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, key):
+        """ Returns the node stored for the hash, or None. """
+        return self.nodes.get(key)
+
+    def put(self, key, node):
+        """ Stores the node for the hash, dropping the oldest entry if the table is full. """
+        if key not in self.nodes and len(self.nodes) >= self.size:
+            del self.nodes[next(iter(self.nodes))]
+        self.nodes[key] = node
+
+
+# The proven value of a node that has not been proven, see NodePool.proven.
+unproven = 2
+
+
+class NodePool:
+    def __init__(self, capacity):
+        """ Stores a whole search tree in preallocated parallel arrays, one entry per node, instead of one MCTSNode
+        object per node. A node is its index in the arrays; the root is node 0. Children are kept as linked lists
+        of edges, so a node shared between transpositions can be the child of several nodes.
+
+        Args:
+            capacity:   The maximum number of nodes (and of edges).
+
+        """
+        self.capacity = capacity
+        self.size = 0                           # Nodes in use
+        self.edges = 0                          # Edges in use
+
+        self.visits = array('q', bytes(8 * capacity))           # Number of times each node has been visited
+        self.wins = array('d', bytes(8 * capacity))             # Total wins of all paths through each node
+        self.parent = array('i', bytes(4 * capacity))           # Parent node, -1 for the root
+        self.parent_action = array('b', bytes(capacity))        # The move that got us to the node, -1 for the root
+        self.first_child = array('i', bytes(4 * capacity))      # First edge to a child, -1 if none
+        self.tried = array('B', bytes(capacity))                # Number of actions expanded so far
+        self.action_count = array('B', bytes(capacity))         # Number of actions to be considered at the node
+        self.proven = array('b', bytes(capacity))               # Proven points for player 1, or unproven
+        self.amaf_visits = array('q', bytes(8 * capacity))      # Playouts where the node's move was played later
+        self.amaf_wins = array('d', bytes(8 * capacity))        # Total wins of those playouts
+
+        self.edge_child = array('i', bytes(4 * capacity))       # Node each edge leads to
+        self.edge_action = array('b', bytes(capacity))          # Action of each edge
+        self.next_sibling = array('i', bytes(4 * capacity))     # Next edge from the same parent, -1 if none
+
+    def clear(self):
+        """ Forgets all nodes, keeping the arrays for the next search. """
+        self.size = 0
+        self.edges = 0
+
+    def is_full(self):
+        return self.size >= self.capacity or self.edges >= self.capacity
+
+    def new_node(self, parent=-1, parent_action=-1, action_count=0):
+        """ Adds a node with no statistics and no children and returns its index.
+
+        Args:
+            parent:         The parent node, -1 for the root.
+            parent_action:  The action taken from the parent node, -1 for the root.
+            action_count:   The number of actions to be considered at the node.
+
+        """
+        node = self.size
+        self.size += 1
+        self.visits[node] = 0
+        self.wins[node] = 0.
+        self.parent[node] = parent
+        self.parent_action[node] = parent_action
+        self.first_child[node] = -1
+        self.tried[node] = 0
+        self.action_count[node] = action_count
+        self.proven[node] = unproven
+        self.amaf_visits[node] = 0
+        self.amaf_wins[node] = 0.
+        return node
+
+    def add_child(self, node, action, child):
+        """ Links child under node by action. """
+        edge = self.edges
+        self.edges += 1
+        self.edge_child[edge] = child
+        self.edge_action[edge] = action
+        self.next_sibling[edge] = self.first_child[node]
+        self.first_child[node] = edge
+
+    def children(self, node):
+        """ Returns the (action, child) pairs of a node. """
+        pairs = []
+        edge = self.first_child[node]
+        while edge >= 0:
+            pairs.append((self.edge_action[edge], self.edge_child[edge]))
+            edge = self.next_sibling[edge]
+        return pairs
+
+    def copy_subtree(self, root, target, adopt=True):
+        """ Copies the subtree under root into the target pool, which is cleared first, with root becoming its
+        node 0. Every node reachable from root is kept, so no expanded move loses its edge. A node keeps its
+        parent if its parent link leads to root, so that replaying parent actions from the new root still reaches
+        it; a shared node whose parent is left behind is adopted by the first kept node that links to it, which is
+        only right if every edge leads to the position its action reaches (i.e. without symmetries).
+
+        Args:
+            root:   The node to become the new root.
+            target: Another NodePool with at least this pool's capacity.
+            adopt:  Whether shared nodes may be given a new parent; if not, the copy fails when one would need it.
+
+        Returns:    A dict mapping the kept nodes to their indices in target, or None if the copy failed.
+
+        """
+        target.clear()
+        # Number the kept nodes breadth first, so parents come before their children.
+        kept = {root: 0}
+        order = [root]
+        links = [(-1, -1)]                      # New parent and parent action of each kept node
+        for node in order:
+            for action, child in reversed(self.children(node)):
+                if child in kept:
+                    continue
+                if self.parent[child] == node:
+                    links.append((kept[node], self.parent_action[child]))
+                elif adopt:
+                    links.append((kept[node], action))
+                else:
+                    continue
+                kept[child] = len(order)
+                order.append(child)
+
+        for node, (parent, parent_action) in zip(order, links):
+            new_node = target.new_node(parent, parent_action, self.action_count[node])
+            target.visits[new_node] = self.visits[node]
+            target.wins[new_node] = self.wins[node]
+            target.tried[new_node] = self.tried[node]
+            target.proven[new_node] = self.proven[node]
+            target.amaf_visits[new_node] = self.amaf_visits[node]
+            target.amaf_wins[new_node] = self.amaf_wins[node]
+            edges = 0
+            for action, child in reversed(self.children(node)):
+                if child in kept:
+                    target.add_child(new_node, action, kept[child])
+                    edges += 1
+            # Each expanded move must still have its edge, or it would never be searched again.
+            if edges != self.tried[node]:
+                target.clear()
+                return None
+        return kept
+
+    def view(self, node=0):
+        """ Returns an MCTSNode-like view of a node, e.g. for tree_to_string. """
+        return NodeView(self, node)
+
+
+class SharedNodePool(NodePool):
+    # The arrays of a NodePool with their typecodes, widest first so that every array stays aligned.
+    layout = (('visits', 'q'), ('wins', 'd'), ('amaf_visits', 'q'), ('amaf_wins', 'd'), ('parent', 'i'),
+              ('first_child', 'i'), ('edge_child', 'i'), ('next_sibling', 'i'), ('parent_action', 'b'), ('tried', 'B'), ('action_count', 'B'),
+              ('proven', 'b'), ('edge_action', 'b'))
+    itemsizes = dict(q=8, d=8, i=4, b=1, B=1)
+
+    def __init__(self, capacity, name=None):
+        """ A NodePool kept in a multiprocessing.shared_memory block, so that several processes can search the
+        same tree. The node and edge counts are shared as well. Processes do not coordinate by themselves: changes
+        to the tree have to be made under a lock shared between them.
+
+        Args:
+            capacity:   The maximum number of nodes (and of edges).
+            name:       The name of the block of another SharedNodePool of the same capacity to attach to; a new
+                        block is created if it is None.
+
+        """
+        self.capacity = capacity
+        total = 16 + sum(self.itemsizes[code] * capacity for field, code in self.layout)
+        if name is not None and sys.version_info >= (3, 13):
+            # only the creator tracks the block, so processes attaching to it do not free it when they exit
+            self.memory = shared_memory.SharedMemory(name=name, size=total, track=False)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=total)
+        self.name = self.memory.name
+        self.owner = name is None
+        self.counts = self.memory.buf[:16].cast('q')  # Nodes and edges in use
+        offset = 16
+        for field, code in self.layout:
+            end = offset + self.itemsizes[code] * capacity
+            setattr(self, field, self.memory.buf[offset:end].cast(code))
+            offset = end
+        if self.owner:
+            self.clear()
+
+    @property
+    def size(self):
+        return self.counts[0]
+
+    @size.setter
+    def size(self, value):
+        self.counts[0] = value
+
+    @property
+    def edges(self):
+        return self.counts[1]
+
+    @edges.setter
+    def edges(self, value):
+        self.counts[1] = value
+
+    def close(self):
+        """ Detaches from the block, and frees it if this pool created it. """
+        self.counts.release()
+        for field, code in self.layout:
+            getattr(self, field).release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class NodeView:
+    """ A read-only view of one node of a NodePool with the attributes of an MCTSNode, so that __repr__ and
+    tree_to_string work on pooled trees. untried_actions is not available, as the pool only counts them. """
+    __slots__ = ('pool', 'node')
+
+    def __init__(self, pool, node):
+        self.pool = pool
+        self.node = node
+
+    @property
+    def parent(self):
+        parent = self.pool.parent[self.node]
+        return None if parent < 0 else NodeView(self.pool, parent)
+
+    @property
+    def parent_action(self):
+        action = self.pool.parent_action[self.node]
+        return None if action < 0 else action
+
+    @property
+    def child_nodes(self):
+        return dict((action, NodeView(self.pool, child)) for action, child in reversed(self.pool.children(self.node)))
+
+    @property
+    def wins(self):
+        return self.pool.wins[self.node]
+
+    @property
+    def visits(self):
+        return self.pool.visits[self.node]
+
+    __repr__ = MCTSNode.__repr__
+    tree_to_string = MCTSNode.tree_to_string
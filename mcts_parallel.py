@@ -0,0 +1,245 @@
+import os
+import atexit
+import random
+import multiprocessing
+from multiprocessing import resource_tracker
+import p3_t3
+import mcts_vanilla
+from mcts_node import SharedNodePool
+
+# With mode 'root', mcts_parallel runs workers independent mcts_vanilla searches of the same position in worker
+# processes, each with num_nodes iterations and its own random seed, and picks the move from their merged root
+# statistics. With mode 'leaf', it builds one tree of num_nodes iterations in this process and plays the
+# rollouts of each batch of leaf_batch leaves on the workers. With mode 'tree', the workers share the
+# num_nodes iterations of one tree kept in shared memory, each one selecting its own leaves with virtual loss; it
+# runs plain MCTS only, without transpositions, the solver, RAVE, endgame solving, value functions, early stops,
+# a game clock, tree reuse or pondering.
+mode = 'root'
+workers = os.cpu_count() or 1
+num_nodes = 1000
+leaf_batch = 4 * workers
+
+# The game setup and engine of the searches run by search_root, one copy per process.
+board = p3_t3.Board()
+engine = mcts_vanilla.MCTSEngine()
+
+_pool = None
+_pool_size = 0
+# Serializes the changes to the shared tree of the 'tree' mode; the workers get this process's lock when they start.
+_lock = None
+
+
+def tree_lock():
+    """ Returns the lock of the shared tree, creating it on first use rather than in every process importing this
+    module. """
+    global _lock
+    if _lock is None:
+        _lock = multiprocessing.Lock()
+    return _lock
+
+
+def share_lock(lock):
+    """ Starts a worker process with the given lock for the shared tree. """
+    global _lock
+    _lock = lock
+
+
+def worker_pool(size):
+    """ Returns the module's process pool, starting it if it does not have the given size. The pool is kept
+    between moves, so that the processes are only started once. """
+    global _pool, _pool_size
+    if _pool is None or _pool_size != size:
+        if _pool is not None:
+            _pool.terminate()
+        # The workers have to share this process's resource tracker: one of their own would warn about the shared
+        # tree they attach to, and unlink it, when they exit.
+        resource_tracker.ensure_running()
+        _pool = multiprocessing.Pool(size, share_lock, (tree_lock(),))
+        _pool_size = size
+    return _pool
+
+
+def search_root(job):
+    """ Runs one search in a worker process.
+
+    Args:
+        job:    A (state, seed, overrides) tuple.
+
+    Returns:    The (action, visits, wins) of each child of the root.
+
+    """
+    state, seed, overrides = job
+    random.seed(seed)
+    engine.search(board, state, **overrides)
+    return engine.root_statistics()
+
+
+def rollout_leaf(job):
+    """ Simulates one leaf in a worker process.
+
+    Args:
+        job:    A (key, fields, rollout_backend, rollouts_per_leaf, rollout_policy, rollout_depth, dead_boards)
+                tuple, fields being the state of the leaf.
+
+    Returns:    The key and the total points of the rollouts for player 1.
+
+    """
+    key, fields, rollout_backend, rollouts_per_leaf, rollout_policy, rollout_depth, dead_boards = job
+    rules = mcts_vanilla.dead_rules if dead_boards else board
+    return key, mcts_vanilla.simulate(board, rules.mutable_state(fields), rollout_backend, rollouts_per_leaf,
+                                      rollout_policy, rollout_depth)
+
+
+def pool_rollouts(board, leaves, settings):
+    """ The rollout_runner of leaf_engine: simulates the leaves on the worker pool, see mcts_vanilla.local_rollouts. """
+    jobs = [(key, fields, settings['rollout_backend'], settings['rollouts_per_leaf'], settings['rollout_policy'],
+             settings['rollout_depth'], settings['dead_boards']) for key, fields in leaves]
+    return worker_pool(_leaf_workers).imap_unordered(rollout_leaf, jobs)
+
+
+# The engine of the 'leaf' mode, with the number of workers it is run with.
+leaf_engine = mcts_vanilla.MCTSEngine()
+leaf_engine.rollout_runner = pool_rollouts
+_leaf_workers = 1
+
+
+# The SharedNodePool of the 'tree' mode: created by the process that calls think, attached to by the workers.
+_tree = None
+
+
+def shared_tree(capacity, name=None):
+    """ Returns the shared tree of the given capacity, creating it (or attaching to the one with the given name)
+    if this process does not have it yet. """
+    global _tree
+    if _tree is None or _tree.capacity != capacity or (name is not None and _tree.name != name):
+        close_tree()
+        _tree = SharedNodePool(capacity, name)
+    return _tree
+
+
+@atexit.register
+def close_tree():
+    """ Detaches from the shared tree, freeing it in the process that created it. """
+    global _tree
+    if _tree is not None:
+        _tree.close()
+        _tree = None
+
+
+def search_tree(job):
+    """ Runs iterations on the shared tree of the 'tree' mode, in a worker process or this one. Selection and
+    expansion, then backpropagation, are done under the shared lock; rollouts run outside it. Each selected path
+    counts virtual losses until its rollout is back, so that the other workers select other leaves.
+
+    Args:
+        job:    A (name, capacity, state, seed, iterations, settings) tuple, name being the name of the tree's
+                shared memory block, iterations this worker's share of num_nodes and settings mcts_vanilla's search
+                settings, whose time and node limits apply to every worker.
+
+    """
+    name, capacity, state, seed, iterations, settings = job
+    random.seed(seed)
+    pool = shared_tree(capacity, name)
+    lock = tree_lock()
+    identity = board.current_player(state)
+    simulations = settings['rollouts_per_leaf']
+    loss_visits = settings['virtual_loss']
+    loss_wins = -mcts_vanilla.id_coeff[identity] * loss_visits
+    sampled_game = board.mutable_state(state)
+    rollout_game = mcts_vanilla.rollout_rules(board, settings).mutable_state(state)
+    widening = None
+    if settings['widening_base'] is not None:
+        widening = (settings['widening_base'], settings['widening_exponent'])
+    budget = mcts_vanilla.SearchBudget(pool, iterations, settings['time_limit'], settings['node_limit'],
+                                       settings['max_overshoot'])
+    for _ in budget:
+        with lock:
+            path = [0]
+            node = mcts_vanilla.traverse_nodes(pool, 0, board, sampled_game, identity, settings['explore_faction'],
+                                               path, widening=widening)
+            terminal = pool.tried[node] == pool.action_count[node]
+            if not terminal and not pool.is_full():
+                path.append(mcts_vanilla.expand_leaf(pool, node, board, sampled_game,
+                                                     move_ordering=settings['move_ordering']))
+            mcts_vanilla.add_virtual_loss(pool, path, loss_visits, loss_wins)
+        if terminal:
+            won = sampled_game.outcome()[1] * simulations
+        else:
+            rollout_game.load(sampled_game.fields)
+            won = mcts_vanilla.simulate(board, rollout_game, settings['rollout_backend'], simulations,
+                                        settings['rollout_policy'], settings['rollout_depth'])
+        with lock:
+            mcts_vanilla.add_virtual_loss(pool, path, -loss_visits, -loss_wins)
+            mcts_vanilla.backpropagate(pool, path[-1], won, simulations, path)
+        sampled_game.load(state)
+
+
+def tree_statistics(board, state, size, settings):
+    """ Builds the shared tree of the state with size workers and returns the statistics of the root's children. """
+    if settings['use_transpositions'] or settings['use_symmetries']:
+        raise ValueError("the 'tree' mode has no shared transposition table")
+    unsupported = [name for name in ('solver', 'rave', 'endgame_empties', 'value_function', 'early_stop',
+                                     'game_clock', 'reuse_tree', 'ponder') if settings[name] not in (None, False)]
+    if unsupported:
+        raise ValueError("the 'tree' mode does not support " + ", ".join(unsupported))
+    pool = shared_tree(settings['pool_capacity'])
+    pool.clear()
+    pool.new_node(action_count=len(board.legal_indices(state)))
+    if settings['num_nodes'] is None:
+        shares = [None] * size
+    else:
+        share, extra = divmod(settings['num_nodes'], size)
+        shares = [share + (worker < extra) for worker in range(size)]
+    jobs = [(pool.name, pool.capacity, state, random.getrandbits(32), shares[worker], settings)
+            for worker in range(size)]
+    if size <= 1:
+        search_tree(jobs[0])
+    else:
+        worker_pool(size).map(search_tree, jobs)
+    return [(action, pool.visits[child], pool.wins[child]) for action, child in reversed(pool.children(0))]
+
+
+def merge_statistics(results):
+    """ Sums the visits and wins of each root move over the given lists of (action, visits, wins). """
+    merged = {}
+    for statistics in results:
+        for action, visits, wins in statistics:
+            total = merged.get(action, (0, 0))
+            merged[action] = (total[0] + visits, total[1] + wins)
+    return [(action, visits, wins) for action, (visits, wins) in merged.items()]
+
+
+def think(board, state, **overrides):
+    """ Performs root-, leaf- or tree-parallel MCTS with this module's settings.
+
+    Args:
+        board:      The game setup.
+        state:      The state of the game.
+        overrides:  Values for mode and workers, or for any of mcts_vanilla's settings (in 'root' mode, num_nodes
+                    is per worker).
+
+    Returns:    The action to be taken.
+
+    """
+    global _leaf_workers
+    search_mode = overrides.pop('mode', mode)
+    size = overrides.pop('workers', workers)
+    overrides.setdefault('num_nodes', num_nodes)
+    if search_mode == 'leaf':
+        overrides.setdefault('leaf_batch', leaf_batch)
+        if size <= 1:
+            return engine.think(board, state, **overrides)
+        _leaf_workers = size
+        return leaf_engine.think(board, state, **overrides)
+    if search_mode == 'tree':
+        statistics = tree_statistics(board, state, size, mcts_vanilla.current_settings(**overrides))
+        return board.decode_action(mcts_vanilla.best_action(statistics, board.current_player(state)))
+    if search_mode != 'root':
+        raise ValueError("unknown parallel mode: " + search_mode)
+    jobs = [(state, random.getrandbits(32), overrides) for _ in range(size)]
+    if size <= 1:
+        results = [search_root(job) for job in jobs]
+    else:
+        results = worker_pool(size).map(search_root, jobs)
+    statistics = merge_statistics(results)
+    return board.decode_action(mcts_vanilla.best_action(statistics, board.current_player(state)))
@@ -0,0 +1,26 @@
+import mcts_vanilla
+
+# mcts_ponder runs the same search as mcts_vanilla, and keeps searching in the background on the opponent's turn.
+num_nodes = 1000
+time_limit = None
+explore_faction = 2.
+
+# This bot's own engine, so that its tree is not mixed up with mcts_vanilla's.
+engine = mcts_vanilla.MCTSEngine()
+
+
+def think(board, state, **overrides):
+    """ Performs MCTS with mcts_vanilla's search and this module's settings, pondering after the move.
+
+    Args:
+        board:      The game setup.
+        state:      The state of the game.
+        overrides:  Values for any of mcts_vanilla's settings in place of this module's, e.g. another num_nodes,
+                    time_limit or node_limit budget.
+
+    Returns:    The action to be taken.
+
+    """
+    settings = dict(num_nodes=num_nodes, time_limit=time_limit, explore_faction=explore_faction, ponder=True)
+    settings.update(overrides)
+    return engine.think(board, state, **settings)
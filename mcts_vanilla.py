@@ -1,154 +1,1044 @@
-from mcts_node import MCTSNode
+import p3_t3
+from mcts_node import NodePool, TranspositionTable, unproven
+from p3_solve import EndgameSolver, empties
+import threading
 from random import choice
 from math import sqrt, log, inf
+from timeit import default_timer as clock
+
+try:
+    import p3_batch
+    import p3_value
+except ImportError:  # numpy is optional; only the 'numpy' rollout backend and value functions need it
+    p3_batch = None
+    p3_value = None
 
 num_nodes = 1000
 explore_faction = 2.
+# The search stops after num_nodes iterations, after time_limit seconds or
+# once the tree has node_limit nodes, whichever comes first; None turns a
+# limit off. The clock is read every few iterations, as many as should take
+# max_overshoot seconds, which bounds how far a search runs past its time.
+time_limit = None
+node_limit = None
+max_overshoot = 0.005
+# Stop before the limits once the move to play is settled (see root_settled):
+# None never does, 'certain' once no other move can overtake its visits in
+# the iterations left, 'confident' once the runner-up would need more than
+# confidence times its share of them. Searches that may stop early play their
+# most visited move, which is the one these rules settle.
+early_stop = None
+confidence = 2.
+# A GameClock to take each search's time limit from and charge its time to.
+game_clock = None
+# Prove the value of nodes from finished games up (MCTS-Solver): a node is won
+# for the player to move if one move wins, and decided if all moves are.
+# Proven moves are no longer selected, and the search stops once the root is
+# proven.
+solver = False
+# Also score moves by their results whenever the player played them later in
+# an iteration's tree path or rollout (RAVE, all moves as first). A child's
+# score blends its own win rate with its AMAF win rate, the latter weighted
+# by sqrt(rave_equivalence/(3*visits + rave_equivalence)).
+rave = False
+rave_equivalence = 300.
+# Solve positions exactly (p3_solve's alpha-beta) once at most endgame_empties
+# squares are clear in the open sub-boards: think plays the solved move without
+# searching, and such leaves get their exact value instead of a rollout (and
+# are proven, with the solver). A solve that needs more than endgame_nodes
+# positions is given up. None turns it off.
+endgame_empties = None
+endgame_nodes = 20000
+# Keep searching in a background thread while the opponent decides, from the
+# position after the move think returned (see MCTSEngine.ponder). The thread
+# stops once the pool is full, or once ponder_idle iterations in a row add
+# nothing to the tree, e.g. when it holds a whole endgame.
+ponder = False
+ponder_idle = 10000
+# 'python' plays rollouts one at a time; 'numpy' plays all rollouts_per_leaf
+# rollouts of a leaf in lockstep with p3_batch.
+rollout_backend = 'python'
+rollouts_per_leaf = 1
+# 'random' plays uniformly random rollouts; 'informed' plays the quick win-now /
+# block-now moves of Board.informed_index (python backend only).
+rollout_policy = 'random'
+# Expand the moves of a node in the order of Board.prior_indices (sub-board
+# wins, blocks, centre squares; moves that let the opponent choose where to
+# play after the others) instead of board order.
+move_ordering = False
+# Progressive widening: a node with n visits is only given another child once
+# it has fewer than widening_base * n**widening_exponent, and selects among the
+# ones it has until then, so that wide nodes let the search go deeper before
+# all their moves are expanded. None expands every move first.
+widening_base = None
+widening_exponent = 0.5
+# Stop each rollout after rollout_depth plies and score the position with
+# Board.evaluate, a lookup-table estimate from -1 to 1, instead of playing on
+# to the end. None plays every rollout to the end.
+rollout_depth = None
+# Score new leaves with the p3_value.ValueFunction whose weights are in this
+# .npz file instead of rolling them out (e.g. 'value_weights.npz', written by
+# python p3_value.py). With leaf_batch, each batch is scored in one call.
+value_function = None
+# Play the rollouts by the rules of p3_t3.Board(close_dead=True): sub-boards
+# that neither player can win close at once, and a game that neither can win
+# ends drawn, which shortens the rollouts. The tree keeps the game's rules.
+dead_boards = False
+# Share one node between all move orders that reach the same position, found
+# by Zobrist hash in a transposition table of at most transposition_size nodes.
+use_transpositions = False
+transposition_size = 200000
+# Also treat the 8 symmetries of a position as one position: symmetric moves
+# are expanded once and symmetric positions share a node (implies the table).
+use_symmetries = False
+# The tree is kept in a NodePool of at most pool_capacity nodes (about 53
+# bytes each), reused between searches. Once it is full, leaves are rolled
+# out without expanding. Re-rooting (see reuse_tree) needs a second pool.
+pool_capacity = 200000
+# Keep the subtree of the position reached one or two moves after the last
+# search, instead of starting every search from an empty tree.
+reuse_tree = False
+# Select leaf_batch leaves before rolling any of them out, so that an engine's
+# rollout_runner can play them all at once (e.g. on other processes). Each
+# selected path counts virtual_loss lost playouts until its result is back,
+# which steers the next selections of the batch to other branches.
+leaf_batch = 1
+virtual_loss = 1
+
+# Names of the module-level settings above that think() accepts as overrides,
+# so that other bots can run this search with their own settings.
+setting_names = ('num_nodes', 'time_limit', 'node_limit', 'max_overshoot', 'early_stop', 'confidence', 'game_clock',
+                 'ponder', 'ponder_idle', 'solver', 'rave', 'rave_equivalence', 'endgame_empties',
+                 'endgame_nodes', 'explore_faction', 'rollout_backend', 'rollouts_per_leaf',
+                 'rollout_policy', 'rollout_depth', 'value_function', 'dead_boards', 'move_ordering', 'widening_base', 'widening_exponent',
+                 'use_transpositions', 'transposition_size', 'use_symmetries', 'pool_capacity', 'reuse_tree',
+                 'leaf_batch', 'virtual_loss')
 
 id_coeff = [0, 1, -1]
 
+# The rules of the rollouts with dead_boards.
+dead_rules = p3_t3.Board(close_dead=True)
 
-def calc_uct(node, identity):
-    #determine uct rating of given node
-    wins = node.wins*id_coeff[identity]
-    return wins/node.visits + explore_faction*sqrt(log(node.parent.visits)/node.visits)
 
+def replay_parents(pool, node, state):
+    """ Plays the parent actions from the root down to node on a state at the root. """
+    actions = []
+    while pool.parent[node] >= 0:
+        actions.append(pool.parent_action[node])
+        node = pool.parent[node]
+    for action in reversed(actions):
+        state.apply(action)
 
-def traverse_nodes(node, board, state, identity):
+
+def traverse_nodes(pool, node, board, state, identity, explore_faction=explore_faction, path=None, solver=False,
+                   rave_equivalence=None, widening=None):
     """ Traverses the tree until the end criterion are met.
 
     Args:
-        node:       A tree node from which the search is traversing.
-        board:      The game setup.
-        state:      The state of the game.
-        identity:   The bot's identity, either 1 or 2.
+        pool:               The NodePool holding the tree.
+        node:               A tree node from which the search is traversing.
+        board:              The game setup.
+        state:              The state of the game at node as a MutableState, advanced in place along the way to
+                            the returned node.
+        identity:           The bot's identity, either 1 or 2.
+        explore_faction:    The exploration constant of the UCT formula.
+        path:               If given, a list that the nodes below node on the way to the leaf are appended to.
+        solver:             Whether to skip proven children. A node whose children are all proven is returned,
+                            and has to be proven by the caller.
+        rave_equivalence:   If given, the win rates are blended with the AMAF win rates, see the rave setting.
+        widening:           If given, a (widening_base, widening_exponent) pair: a node that may have more
+                            children, see the settings, is returned to be expanded.
 
     Returns:        A node from which the next stage of the search can proceed.
    
     """
+    visits = pool.visits
+    parent = pool.parent
+    first_child = pool.first_child
+    edge_child = pool.edge_child
+    edge_action = pool.edge_action
+    next_sibling = pool.next_sibling
+    tried = pool.tried
+    action_count = pool.action_count
+    proven = pool.proven
+    wins = pool.wins
+    amaf_visits = pool.amaf_visits
+    amaf_wins = pool.amaf_wins
+    sign = id_coeff[identity]
     #UCT based selection
     current_node = node
-    while not current_node.untried_actions and current_node.child_nodes:
+    while first_child[current_node] >= 0:
+        if tried[current_node] < action_count[current_node] and (
+                widening is None or tried[current_node] < widening[0]*visits[current_node]**widening[1]):
+            break
+        #uct rating of each child against the parent it is reached from, wins/visits +
+        #explore_faction*sqrt(log(parent visits)/visits) for the bot, with the parent's log taken once per node:
+        #(sign*wins + c*sqrt(visits))/visits for c = explore_faction*sqrt(log(parent visits))
+        c = explore_faction*sqrt(log(visits[current_node]))
         best_uct = -inf
         next_node = None
-        for _, child in current_node.child_nodes.items():
-            child.visits += 1
-            child_uct = calc_uct(child, identity)
+        edge = first_child[current_node]
+        while edge >= 0:
+            child = edge_child[edge]
+            if solver and proven[child] != unproven:
+                edge = next_sibling[edge]
+                continue
+            child_visits = visits[child]
+            if rave_equivalence is None:
+                child_uct = (sign*wins[child] + c*sqrt(child_visits))/child_visits
+            else:
+                child_uct = sign*wins[child]/child_visits
+                if amaf_visits[child]:
+                    beta = sqrt(rave_equivalence/(3*child_visits + rave_equivalence))
+                    child_uct += beta*(sign*amaf_wins[child]/amaf_visits[child] - child_uct)
+                child_uct += c/sqrt(child_visits)
             if child_uct > best_uct:
                 next_node = child
+                next_action = edge_action[edge]
                 best_uct = child_uct
+            edge = next_sibling[edge]
+        if next_node is None:
+            return current_node
+        if parent[next_node] == current_node:
+            state.apply(next_action)
+        else:
+            #a shared node's moves are stored as seen from its parent links, which may be a symmetric
+            #position, so go back to the root and follow those instead
+            state.rewind()
+            replay_parents(pool, next_node, state)
         current_node = next_node
+        if path is not None:
+            path.append(current_node)
     return current_node #"leaf" found by taking highest UCT actions
 
 
-def expand_leaf(node, board, state):
+def expand_leaf(pool, node, board, state, table=None, move_ordering=False):
     """ Adds a new leaf to the tree by creating a new child node for the given node.
 
     Args:
+        pool:   The NodePool holding the tree; it must not be full.
         node:   The node for which a child will be added.
         board:  The game setup.
-        state:  The state of the game.
+        state:  The state of the game at node as a MutableState, advanced in place to the new leaf. It must be a
+                HashedState or SymmetricState when a table is given.
+        table:  An optional TranspositionTable. If the new position is already in it, its node becomes the
+                child instead of a new one.
+        move_ordering:  Whether the moves are expanded in the order of Board.prior_indices.
 
     Returns:    The added child node.
 
     """
-    new_action = node.untried_actions.pop(0)
-    state = board.next_state(state, new_action)
-    new_node = MCTSNode(node, new_action, board.legal_actions(state))
-    node.child_nodes[new_action] = new_node
+    #the untried actions are the ones after the first tried ones, in order
+    actions = state.distinct_indices()
+    if move_ordering:
+        actions = board.prior_indices(state.fields, actions)
+    new_action = actions[pool.tried[node]]
+    pool.tried[node] += 1
+    state.apply(new_action)
+    if table is not None:
+        key = state.position_key()
+        new_node = table.get(key)
+        if new_node is not None:
+            #reached by another move order, so share the node and its statistics
+            pool.add_child(node, new_action, new_node)
+            return new_node
+    #a finished game has no moves to try, even if some sub-boards are still open
+    action_count = len(state.distinct_indices()) if state.outcome() is None else 0
+    new_node = pool.new_node(node, new_action, action_count)
+    if action_count == 0:
+        pool.proven[new_node] = state.outcome()[1]
+    pool.add_child(node, new_action, new_node)
+    if table is not None:
+        table.put(key, new_node)
     return new_node
 
 
-def rollout(board, state):
+def rollout(board, state, rollout_policy=rollout_policy, rollout_depth=None):
     """ Given the state of the game, the rollout plays out the remainder randomly.
 
     Args:
-        board:  The game setup.
-        state:  The state of the game.
+        board:          The game setup.
+        state:          The state of the game as a MutableState, played out in place.
+        rollout_policy: 'random' or 'informed', see the module setting.
+        rollout_depth:  Stop after this many plies (None to play to the end).
+
+    Returns:    The points of the finished game for player 1, or Board.evaluate's estimate of them if the rollout
+                was stopped first.
 
     """
-    while not board.is_ended(state):
+    outcome = state.outcome()
+    if rollout_depth is not None:
+        informed = rollout_policy == 'informed'
+        fields = state.fields
+        for _ in range(rollout_depth):
+            if outcome is not None:
+                return outcome[1]
+            state.apply(board.informed_index(fields) if informed else choice(state.legal_indices()))
+            outcome = state.outcome()
+        return outcome[1] if outcome is not None else board.evaluate(fields)
+    if rollout_policy == 'informed':
+        fields = state.fields
+        while outcome is None:
+            state.apply(board.informed_index(fields))
+            outcome = state.outcome()
+        return outcome[1]
+    while outcome is None:
         #choice selects a legal action at random
-        rand_action = choice(board.legal_actions(state))
+        rand_action = choice(state.legal_indices())
         #we follow the ouctome of that action until the end
-        state = board.next_state(state, rand_action)
-    return state #remember all point values are for player 1
+        state.apply(rand_action)
+        outcome = state.outcome()
+    return outcome[1] #remember all point values are for player 1
+
+
+def rollout_rules(board, settings):
+    """ Returns the board whose rules the rollouts are played by, see the dead_boards setting. """
+    return dead_rules if settings['dead_boards'] else board
+
+
+def simulate(board, state, rollout_backend=rollout_backend, rollouts_per_leaf=rollouts_per_leaf,
+             rollout_policy=rollout_policy, rollout_depth=rollout_depth):
+    """ Plays several rollouts from the state of a new leaf.
+
+    Args:
+        board:              The game setup.
+        state:              The state of the game as a MutableState, whose board's rules the rollouts follow
+                            (see rollout_rules). The python backend plays on it and leaves it at the end of the
+                            last rollout.
+        rollout_backend:    'python' or 'numpy'.
+        rollouts_per_leaf:  The number of rollouts to play.
+        rollout_policy:     'random' or 'informed'.
+        rollout_depth:      The number of plies after which a rollout is scored by Board.evaluate, or None.
+
+    Returns:    The total points of the rollouts for player 1.
+
+    """
+    if rollout_backend == 'numpy':
+        if p3_batch is None:
+            raise ImportError("the 'numpy' rollout backend needs numpy")
+        if rollout_policy != 'random':
+            raise ValueError("the 'numpy' rollout backend only plays random rollouts")
+        games = p3_batch.batch_rollouts([state.fields] * rollouts_per_leaf, max_plies=rollout_depth,
+                                        close_dead=state.board.close_dead)
+        if rollout_depth is not None:
+            return float(games.evaluate().sum())
+        return int(games.points.sum())
+    if state.board.close_dead:
+        #the leaf was reached by the game's rules
+        state.board.close_dead_boards(state.fields)
+    start = state.plies()
+    won = rollout(board, state, rollout_policy, rollout_depth)
+    for _ in range(rollouts_per_leaf - 1):
+        while state.plies() > start:
+            state.undo()
+        won += rollout(board, state, rollout_policy, rollout_depth)
+    return won
+
+
+def value_rollouts(value_function):
+    """ Returns a rollout_runner that scores leaves with a p3_value.ValueFunction instead of playing them out, all
+    the leaves of a batch at once; finished games get their points. See local_rollouts. """
+    def runner(board, leaves, settings):
+        values = value_function.evaluate([fields for key, fields in leaves])
+        simulations = settings['rollouts_per_leaf']
+        for (key, fields), value in zip(leaves, values):
+            outcome = board.outcome(fields)
+            yield key, (float(value) if outcome is None else outcome[1]) * simulations
+    return runner
+
+
+def local_rollouts(board, leaves, settings):
+    """ Simulates leaves one after another, for engines without another rollout_runner.
+
+    Args:
+        board:      The game setup.
+        leaves:     A list of (key, fields) pairs, fields being the state of a leaf.
+        settings:   The search settings, for rollout_backend, rollouts_per_leaf, rollout_policy, rollout_depth and
+                    dead_boards.
+
+    Returns:    An iterator over (key, won) pairs, in any order.
+
+    """
+    game = rollout_rules(board, settings).mutable_state(board.starting_state())
+    for key, fields in leaves:
+        game.load(fields)
+        yield key, simulate(board, game, settings['rollout_backend'], settings['rollouts_per_leaf'],
+                            settings['rollout_policy'], settings['rollout_depth'])
+
 
-def backpropagate(node, won):
+def add_virtual_loss(pool, path, visits, wins):
+    """ Adds visits and wins to every node of the path, to count (or, negated, uncount) the virtual loss of a
+    playout that is still running. """
+    pool_visits = pool.visits
+    pool_wins = pool.wins
+    for node in path:
+        pool_visits[node] += visits
+        pool_wins[node] += wins
+
+
+def backpropagate(pool, node, won, simulations=1, path=None):
     """ Navigates the tree from a leaf node to the root, updating the win and visit count of each node along the path.
 
     Args:
-        node:   A leaf node.
-        won:    An indicator of whether the bot won or lost the game.
+        pool:           The NodePool holding the tree.
+        node:           A leaf node.
+        won:            An indicator of whether the bot won or lost the game.
+        simulations:    The number of games that won totals.
+        path:           The nodes from the root to the leaf, as recorded by traverse_nodes and expand_leaf. The
+                        parent links are followed if it is not given.
 
     """
-    node.visits += 1
+    visits = pool.visits
+    wins = pool.wins
+    if path is None:
+        path = []
+        while node >= 0:
+            path.append(node)
+            node = pool.parent[node]
     #Total score of the whole path to get to that node
-    node.wins += won #won should be -1 for loss, 0 for draw, 1 for win
-    while node.parent:
-        node.parent.visits +=1
-        node.parent.wins += won
-        node = node.parent
+    for path_node in path:
+        visits[path_node] += simulations
+        wins[path_node] += won #won should be -1 for loss, 0 for draw, 1 for win
+
+
+class SearchBudget(object):
+    # Iterations between calls to settled
+    settled_interval = 64
+
+    def __init__(self, pool, num_nodes=None, time_limit=None, node_limit=None, max_overshoot=max_overshoot, start=None,
+                 settled=None, halted=None, idle_limit=None):
+        """ Decides when a search stops, see the settings of the same names. Iterating over it yields until the
+        search should stop, counting one iteration each time.
+
+        Args:
+            pool:           The NodePool of the search, for node_limit.
+            num_nodes:      The number of iterations, or None.
+            time_limit:     The number of seconds from now, or None.
+            node_limit:     The number of nodes of the tree, or None.
+            max_overshoot:  The seconds the search may take past time_limit.
+            start:          The time the search started, if before now.
+            settled:        A function returning whether the search can stop early, or None.
+            halted:         A function returning whether the search has to stop now, e.g. because another thread
+                            asked it to, or None.
+            idle_limit:     Stop once this many iterations in a row add no node or edge to the pool, or None.
+
+        """
+        if num_nodes is None and time_limit is None and node_limit is None:
+            raise ValueError("the search needs an iteration, time or node limit")
+        self.pool = pool
+        self.num_nodes = num_nodes
+        self.node_limit = node_limit
+        self.max_overshoot = max_overshoot
+        self.start = clock() if start is None else start
+        self.deadline = None if time_limit is None else self.start + time_limit
+        self.iterations = 0         # Iterations done so far
+        self.next_check = 1         # Iterations after which to read the clock again
+        self.next_settled = self.settled_interval   # Iterations after which to call settled again
+        self.settled = settled
+        self.settled_early = False  # Whether settled stopped the search
+        self.halted = halted
+        self.idle_limit = idle_limit
+        self.grown_at = 0           # The last iteration after which the pool had grown
+        self.pool_usage = None      # The nodes plus edges of the pool then
+        self.end = None             # The time the search stopped, once it has
 
+    def __iter__(self):
+        while self.running():
+            yield self.iterations
+            self.iterations += 1
 
-def think(board, state):
-    """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
+    def running(self):
+        """ Returns whether the search should do another iteration, recording the time it stopped if not. """
+        if self.halted is not None and self.halted():
+            return self.stop()
+        if self.num_nodes is not None and self.iterations >= self.num_nodes:
+            return self.stop()
+        if self.node_limit is not None and self.pool.size >= self.node_limit:
+            return self.stop()
+        if self.idle_limit is not None:
+            usage = self.pool.size + self.pool.edges
+            if usage != self.pool_usage:
+                self.pool_usage = usage
+                self.grown_at = self.iterations
+            elif self.iterations - self.grown_at >= self.idle_limit:
+                return self.stop()
+        if self.deadline is not None and self.iterations >= self.next_check:
+            now = clock()
+            if now >= self.deadline:
+                return self.stop()
+            # read the clock again after as many iterations as fit in max_overshoot at the speed so far
+            per_iteration = (now - self.start) / max(self.iterations, 1)
+            self.next_check = self.iterations + max(1, int(min(self.deadline - now, self.max_overshoot)
+                                                           / max(per_iteration, 1e-9)))
+        if self.settled is not None and self.iterations >= self.next_settled:
+            # batched searches count several iterations at a time
+            self.next_settled = self.iterations + self.settled_interval
+            if self.settled():
+                self.settled_early = True
+                return self.stop()
+        return True
+
+    def remaining(self):
+        """ Returns the number of iterations left under the iteration and time limits, the latter estimated from
+        the speed so far, or None if neither is set. """
+        left = None
+        if self.num_nodes is not None:
+            left = self.num_nodes - self.iterations
+        if self.deadline is not None:
+            now = clock()
+            per_iteration = (now - self.start) / max(self.iterations, 1)
+            by_time = int((self.deadline - now) / max(per_iteration, 1e-9)) + 1
+            left = by_time if left is None else min(left, by_time)
+        return left
+
+    def batch(self, size):
+        """ Returns how many of the next size iterations the iteration limit allows. """
+        if self.num_nodes is None:
+            return size
+        return min(size, self.num_nodes - self.iterations)
+
+    def stop(self):
+        self.end = clock()
+        return False
+
+    def overshoot(self):
+        """ Returns the seconds the search ran past its time limit (negative if it stopped before). """
+        return self.end - self.deadline
+
+
+def root_settled(pool, identity, remaining, rule=early_stop, z=confidence, simulations=1):
+    """ Checks whether the root's most visited move, the one best_action picks when stopping early, is settled: it
+    needs a lead in visits the other moves cannot make up, and has to have the best win rate as well.
 
     Args:
-        board:  The game setup.
-        state:  The state of the game.
+        pool:           The NodePool holding the tree, with the root at node 0.
+        identity:       The bot's identity, either 1 or 2.
+        remaining:      The number of iterations the search has left, or None if unknown.
+        rule:           'certain': the lead is larger than the visits of the remaining iterations.
+                        'confident': the lead is larger than z times the runner-up's share of the visits so far,
+                        of the visits of the remaining iterations.
+        z:              The factor of the 'confident' rule.
+        simulations:    The visits each iteration adds, see rollouts_per_leaf.
+
+    Returns:    True if the search can stop, which is never before every move of the root has been tried.
+
+    """
+    if remaining is None or pool.tried[0] < pool.action_count[0] or pool.action_count[0] < 2:
+        return False
+    sign = id_coeff[identity]
+    children = [(pool.visits[child], sign * pool.wins[child]) for action, child in pool.children(0)]
+    children.sort(reverse=True)
+    (most, most_wins), (second, second_wins) = children[0], children[1]
+    if any(wins / visits > most_wins / most for visits, wins in children[1:]):
+        return False
+    left = remaining * simulations
+    if rule == 'certain':
+        return most - second > left
+    if rule == 'confident':
+        return most - second > z * left * second / pool.visits[0]
+    raise ValueError("unknown early stopping rule: " + rule)
+
+
+class GameClock(object):
+    def __init__(self, total, moves_per_game=30, min_moves_to_go=5):
+        """ The time one bot has for a whole game. Each search is allotted the time left divided by the number of
+        moves the bot is expected to have left, so the time a search does not use, e.g. by stopping early, goes to
+        the later ones.
+
+        Args:
+            total:              The seconds for the whole game.
+            moves_per_game:     The moves each player is expected to make in a game (random games last about
+                                59 plies).
+            min_moves_to_go:    The fewest moves left an allotment assumes, however far the game is.
+
+        """
+        self.remaining = total
+        self.moves_per_game = moves_per_game
+        self.min_moves_to_go = min_moves_to_go
+
+    def allotment(self, state):
+        """ Returns the seconds for the search of the state. """
+        plies = sum(bin(mask).count('1') for mask in state[:18])
+        moves_to_go = max(self.moves_per_game - plies // 2, self.min_moves_to_go)
+        return max(self.remaining, 0.) / moves_to_go
+
+    def charge(self, seconds):
+        """ Takes the seconds a search used off the time left. """
+        self.remaining -= seconds
+
+
+def prove(pool, node, player):
+    """ Proves the value of a node from its children if they decide it: if one is won for the player to move, or
+    if all moves have been tried and all are proven.
+
+    Args:
+        pool:   The NodePool holding the tree.
+        node:   The node to prove.
+        player: The player to move at the node.
 
-    Returns:    The action to be taken.
+    Returns:    The proven points of the node for player 1, or unproven.
 
     """
-    identity_of_bot = board.current_player(state)
-    root_node = MCTSNode(parent=None, parent_action=None, action_list=board.legal_actions(state))
-
-    for _ in range(num_nodes):
-        # Copy the game for sampling a playthrough
-        sampled_game = state
-
-        # Start at root
-        node = root_node
-
-        # Do MCTS - This is all you!
-        node = traverse_nodes(node, board, sampled_game, identity_of_bot)
-        #update state with actions taken to select selected_node
-        selected_node = node
-        select_actions = []
-        while selected_node.parent:
-            select_actions.append(selected_node.parent_action)
-            selected_node = selected_node.parent
-        select_actions.reverse()
-        for action in select_actions:
-            sampled_game = board.next_state(sampled_game, action)
-        #handle possible selection of terminal node
-        if not node.untried_actions:
-            won = board.points_values(sampled_game)[1]
+    proven = pool.proven
+    won = id_coeff[player]
+    decided = pool.tried[node] == pool.action_count[node]
+    best = None
+    for action, child in pool.children(node):
+        value = proven[child]
+        if value == won:
+            best = value
+            decided = True
+            break
+        if value == unproven:
+            decided = False
+        elif best is None or value * won > best * won:
+            best = value
+    if decided and best is not None:
+        proven[node] = best
+        return best
+    return unproven
+
+
+def update_amaf(pool, path, moves, won, simulations=1):
+    """ Updates the AMAF statistics of the children of the nodes of a path: a child counts the playout if the
+    player to move at its parent played its move at any later point.
+
+    Args:
+        pool:           The NodePool holding the tree.
+        path:           The nodes from the root to the leaf.
+        moves:          The actions played from the root, through the path and the rollout.
+        won:            The points of the playout for player 1.
+        simulations:    The number of games that won totals.
+
+    """
+    first_child = pool.first_child
+    edge_child = pool.edge_child
+    edge_action = pool.edge_action
+    next_sibling = pool.next_sibling
+    amaf_visits = pool.amaf_visits
+    amaf_wins = pool.amaf_wins
+    #a square is played at most once, so each action has one ply
+    played = dict((action, ply) for ply, action in enumerate(moves))
+    for depth, node in enumerate(path):
+        edge = first_child[node]
+        while edge >= 0:
+            ply = played.get(edge_action[edge])
+            if ply is not None and ply >= depth and (ply - depth) % 2 == 0:
+                child = edge_child[edge]
+                amaf_visits[child] += simulations
+                amaf_wins[child] += won
+            edge = next_sibling[edge]
+
+
+def backpropagate_proofs(pool, path, player):
+    """ Proves the nodes of a path from the bottom up, for as long as the node below has been proven.
+
+    Args:
+        pool:   The NodePool holding the tree.
+        path:   The nodes from the root to the leaf.
+        player: The player to move at the root.
+
+    """
+    proven = pool.proven
+    for depth in range(len(path) - 2, -1, -1):
+        node = path[depth]
+        if proven[path[depth + 1]] == unproven or proven[node] != unproven:
+            return
+        if prove(pool, node, player if depth % 2 == 0 else 3 - player) == unproven:
+            return
+
+
+def current_settings(**overrides):
+    """ Returns this module's search settings as a dict, with the given overrides applied. """
+    unknown = set(overrides) - set(setting_names)
+    if unknown:
+        raise TypeError("unknown search settings: " + ", ".join(sorted(unknown)))
+    settings = dict((name, globals()[name]) for name in setting_names)
+    settings.update(overrides)
+    return settings
+
+
+class MCTSEngine(object):
+    def __init__(self):
+        """ Runs the searches of one bot and keeps its tree between moves, so that with reuse_tree the part of the
+        tree under the position actually reached is searched further instead of being thrown away.
+
+        The tree lives in one of two NodePools; re-rooting copies the kept subtree into the other one, which frees
+        everything else.
+        """
+        self.pool = None            # NodePool holding the tree, with the root at node 0
+        self.spare = None           # NodePool the next re-rooted tree is copied into, made by the first re-root
+        self.table = None           # TranspositionTable of the tree, if it uses one
+        self.root_state = None      # The state at node 0, None when there is no tree to reuse
+        self.structure = None       # The settings the tree was built with that decide its shape
+        self.rollout_runner = local_rollouts    # Simulates the leaves of a batch, see local_rollouts
+        self.budget = None          # The SearchBudget of the last search
+        self.interrupted = False    # Whether the last search was stopped by a KeyboardInterrupt
+        self.ponderer = None        # The thread searching during the opponent's turn, see ponder
+        self.halt = None            # The threading.Event that stops the ponderer's search
+        self.endgame = None         # The EndgameSolver of the exact endgame, kept for its table
+        self.value_functions = {}   # The ValueFunctions loaded for the value_function setting, by file
+
+    def endgame_solver(self, board):
+        """ Returns the engine's EndgameSolver, creating it on first use. """
+        if self.endgame is None:
+            self.endgame = EndgameSolver(board)
+        return self.endgame
+
+    def value_runner(self, path):
+        """ Returns a value_rollouts runner for the weights in the given file, loading them on first use. """
+        if path not in self.value_functions:
+            if p3_value is None:
+                raise ImportError("value functions need numpy")
+            self.value_functions[path] = value_rollouts(p3_value.ValueFunction.load(path))
+        return self.value_functions[path]
+
+    def pools(self, capacity):
+        """ Makes sure the pool has the given capacity, dropping the tree (and the spare pool) if it had another
+        one. """
+        if self.pool is None or self.pool.capacity != capacity:
+            self.pool = self.spare = None
+            self.pool = NodePool(capacity)
+            self.root_state = None
+
+    def reroot(self, board, state):
+        """ Moves the root of the tree to the given state if it is the old root or one or two moves after it.
+
+        Returns:    True if a subtree was kept, False if the search has to start from an empty tree.
+
+        """
+        old = self.root_state
+        self.root_state = None
+        if old is None:
+            return False
+        if old == state:
+            return True
+        # The moves played since the old root are the squares that were filled since.
+        added = [
+            [9 * B + cell for cell in range(9) if (state[2 * B + player] & ~old[2 * B + player]) & (1 << cell)]
+            for player in (0, 1) for B in range(9)
+        ]
+        mover = old[-1] - 1
+        mine = sum((added[9 * mover + B] for B in range(9)), [])
+        theirs = sum((added[9 * (1 - mover) + B] for B in range(9)), [])
+        if len(mine) != 1 or len(theirs) > 1:
+            return False
+        actions = mine + theirs
+
+        # Follow the moves down the tree through nodes created by them, so the new root's moves are in the
+        # orientation of the actual state.
+        pool = self.pool
+        node = 0
+        replayed = old
+        for action in actions:
+            replayed = board.next_state_index(replayed, action)
+            for edge_action, child in pool.children(node):
+                if edge_action == action and pool.parent[child] == node:
+                    node = child
+                    break
+            else:
+                return False
+        if replayed != state:
+            return False
+
+        # With symmetries a node's moves are in the orientation of its parent, so shared nodes cannot move.
+        if self.spare is None:
+            self.spare = NodePool(pool.capacity)
+        kept = pool.copy_subtree(node, self.spare, adopt=not self.structure[1])
+        if kept is None:
+            return False
+        self.pool, self.spare = self.spare, self.pool
+        if self.table is not None:
+            nodes = self.table.nodes
+            self.table.nodes = dict((key, kept[old_node]) for key, old_node in nodes.items() if old_node in kept)
+        return True
+
+    def search(self, board, state, **overrides):
+        """ Performs MCTS by sampling games and calling the appropriate functions to construct the game tree.
+
+        Args:
+            board:      The game setup.
+            state:      The state of the game, which becomes the root of the tree.
+            overrides:  Values for any of the settings in setting_names, in place of this module's.
+
+        """
+        start = clock()
+        settings = current_settings(**overrides)
+        simulations = settings['rollouts_per_leaf']
+        identity_of_bot = board.current_player(state)
+        # Copy the game for sampling playthroughs; it is played forward and reloaded each iteration.
+        # The root's hashes are kept so that reloading does not recompute them.
+        if settings['use_symmetries']:
+            sampled_game = board.symmetric_state(state)
+            root_hashes = sampled_game.hashes
+        elif settings['use_transpositions']:
+            sampled_game = board.hashed_state(state)
+            root_hashes = sampled_game.hash
         else:
-            #expand from selection
-            node = expand_leaf(node, board, sampled_game)
-            #update simulated state
-            sampled_game = board.next_state(sampled_game, node.parent_action)
-            # simulate game from new node
-            sampled_game = rollout(board, sampled_game)
-            won = board.points_values(sampled_game)[1]
-        # update tree
-        backpropagate(node, won)
+            sampled_game = board.mutable_state(state)
+
+        self.pools(settings['pool_capacity'])
+        structure = (settings['use_transpositions'], settings['use_symmetries'], settings['transposition_size'],
+                     settings['move_ordering'])
+        reused = settings['reuse_tree'] and structure == self.structure and self.reroot(board, state)
+        self.structure = structure
+        self.root_state = None      # until the search is done
+        pool = self.pool
+        root_node = 0
+        if not reused:
+            pool.clear()
+            pool.new_node(action_count=len(sampled_game.distinct_indices()))
+            self.table = None
+            if settings['use_transpositions'] or settings['use_symmetries']:
+                self.table = TranspositionTable(settings['transposition_size'])
+                self.table.put(sampled_game.position_key(), root_node)
+        table = self.table
+        solver = settings['solver']
+        rave_equivalence = settings['rave_equivalence'] if settings['rave'] else None
+        widening = None
+        if settings['widening_base'] is not None:
+            widening = (settings['widening_base'], settings['widening_exponent'])
+        move_ordering = settings['move_ordering']
+        endgame_empties = settings['endgame_empties']
+        endgame = None if endgame_empties is None else self.endgame_solver(board)
+
+        def select_leaf():
+            # Do MCTS - This is all you!
+            #selection plays the chosen actions on the sampled game and records the path for backpropagation
+            node = root_node
+            path = [node]
+            node = traverse_nodes(pool, node, board, sampled_game, identity_of_bot, settings['explore_faction'], path,
+                                  solver, rave_equivalence, widening)
+            #a node whose children are all proven is proven itself
+            if solver and pool.tried[node] == pool.action_count[node] and pool.first_child[node] >= 0:
+                depth = len(path) - 1
+                value = prove(pool, node, identity_of_bot if depth % 2 == 0 else 3 - identity_of_bot)
+                return path, value * simulations
+            #handle possible selection of terminal node
+            if pool.tried[node] == pool.action_count[node]:
+                return path, sampled_game.outcome()[1] * simulations
+            #expand from selection, which also moves the sampled game to the new node
+            if not pool.is_full():
+                path.append(expand_leaf(pool, node, board, sampled_game, table, move_ordering))
+            #an endgame leaf gets its exact value
+            if endgame is not None and empties(sampled_game.fields) <= endgame_empties:
+                solved = endgame.solve(sampled_game.fields, settings['endgame_nodes'])
+                if solved is not None:
+                    points = solved[0] * id_coeff[sampled_game.fields[22]]
+                    if solver:
+                        pool.proven[path[-1]] = points
+                    return path, points * simulations
+            return path, None
+
+        def restart():
+            # take the sampled game back to the root for the next iteration
+            if table is not None:
+                sampled_game.load(state, root_hashes)
+            else:
+                sampled_game.load(state)
+
+        time_limit = settings['time_limit']
+        game_clock = settings['game_clock']
+        if game_clock is not None:
+            allotment = game_clock.allotment(state)
+            time_limit = allotment if time_limit is None else min(time_limit, allotment)
+        settled = None
+        if settings['early_stop'] is not None:
+            def settled():
+                return root_settled(pool, identity_of_bot, budget.remaining(), settings['early_stop'],
+                                    settings['confidence'], simulations)
+        halt = self.halt
+        halted = None
+        if solver or halt is not None:
+            def halted():
+                # stop pondering when asked to, and any search once its result is proven
+                return (halt is not None and halt.is_set()) or (solver and pool.proven[root_node] != unproven)
+        # only the pondering search, the one that can be halted, has no other limit it is sure to reach
+        idle_limit = settings['ponder_idle'] if halt is not None else None
+        budget = self.budget = SearchBudget(pool, settings['num_nodes'], time_limit, settings['node_limit'],
+                                            settings['max_overshoot'], start, settled, halted, idle_limit)
+        self.interrupted = False
+        rollout_runner = self.rollout_runner
+        if settings['value_function'] is not None:
+            rollout_runner = self.value_runner(settings['value_function'])
+        try:
+            if settings['leaf_batch'] <= 1 and settings['value_function'] is None:
+                # Rollouts are played on their own copy, so that they skip the hashing
+                rollout_game = rollout_rules(board, settings).mutable_state(state)
+                for _ in budget:
+                    path, won = select_leaf()
+                    if won is None:
+                        # simulate game from new node
+                        rollout_game.load(sampled_game.fields)
+                        won = simulate(board, rollout_game, settings['rollout_backend'], simulations,
+                                       settings['rollout_policy'], settings['rollout_depth'])
+                        if rave_equivalence is not None:
+                            #the moves of the (last) python rollout count too
+                            update_amaf(pool, path, sampled_game.history[::5] + rollout_game.history[::5], won,
+                                        simulations)
+                    elif rave_equivalence is not None:
+                        update_amaf(pool, path, sampled_game.history[::5], won, simulations)
+                    # update tree
+                    backpropagate(pool, path[-1], won, simulations, path)
+                    if solver:
+                        backpropagate_proofs(pool, path, identity_of_bot)
+                    restart()
+            else:
+                loss_visits = settings['virtual_loss']
+                loss_wins = -id_coeff[identity_of_bot] * loss_visits
+                while budget.running():
+                    batch = budget.batch(settings['leaf_batch'])
+                    budget.iterations += batch
+                    paths = []
+                    path_moves = []
+                    leaves = []
+                    for _ in range(batch):
+                        path, won = select_leaf()
+                        if won is None:
+                            add_virtual_loss(pool, path, loss_visits, loss_wins)
+                            paths.append(path)
+                            #only the moves in the tree count for RAVE, as the rollouts are played elsewhere
+                            path_moves.append(sampled_game.history[::5])
+                            leaves.append((len(leaves), tuple(sampled_game.fields)))
+                        else:
+                            if rave_equivalence is not None:
+                                update_amaf(pool, path, sampled_game.history[::5], won, simulations)
+                            backpropagate(pool, path[-1], won, simulations, path)
+                            if solver:
+                                backpropagate_proofs(pool, path, identity_of_bot)
+                        restart()
+                    # update the tree as the results come back
+                    for key, won in rollout_runner(board, leaves, settings):
+                        path = paths[key]
+                        add_virtual_loss(pool, path, -loss_visits, -loss_wins)
+                        if rave_equivalence is not None:
+                            update_amaf(pool, path, path_moves[key], won, simulations)
+                        backpropagate(pool, path[-1], won, simulations, path)
+                        if solver:
+                            backpropagate_proofs(pool, path, identity_of_bot)
+        except KeyboardInterrupt:
+            # keep the best move so far, but not the tree, which may be halfway through an update
+            self.interrupted = True
+            budget.stop()
+            return
+        finally:
+            if game_clock is not None:
+                game_clock.charge(clock() - start)
+        self.root_state = state
+
+    def root_statistics(self):
+        """ Returns the (action, visits, wins) of each child of the root, in the order they were expanded. A child
+        an interrupted search expanded but did not get to visit is left out. """
+        pool = self.pool
+        return [(action, pool.visits[child], pool.wins[child]) for action, child in reversed(pool.children(0))
+                if pool.visits[child]]
+
+    def solved_statistics(self, identity, statistics):
+        """ Narrows root_statistics down by the solver's proofs: to the moves that get the root's proven value if
+        it has one, otherwise to the moves not proven lost for identity, if there are any. """
+        pool = self.pool
+        proven = dict((action, pool.proven[child]) for action, child in pool.children(0))
+        if pool.proven[0] != unproven:
+            wanted = [entry for entry in statistics if proven[entry[0]] == pool.proven[0]]
+        else:
+            lost = -id_coeff[identity]
+            wanted = [entry for entry in statistics if proven[entry[0]] != lost]
+        return wanted or statistics
+
+    def think(self, board, state, **overrides):
+        """ Searches the state and picks a move, see search and best_action. With endgame_empties, a position
+        that is solved within endgame_nodes is played without searching.
+
+        Returns:    The action to be taken.
+
+        """
+        settings = current_settings(**overrides)
+        pondering = settings['ponder']
+        self.stop_pondering()
+        if settings['endgame_empties'] is not None and empties(state) <= settings['endgame_empties']:
+            solved = self.endgame_solver(board).solve(state, settings['endgame_nodes'])
+            if solved is not None:
+                return board.decode_action(solved[1])
+        if pondering:
+            # the pondering search left the tree at the position the opponent moved from
+            overrides = dict(overrides, reuse_tree=True)
+        self.search(board, state, **overrides)
+        statistics = self.root_statistics()
+        if settings['solver']:
+            statistics = self.solved_statistics(board.current_player(state), statistics)
+        if not statistics:
+            # interrupted before the first visit
+            action = board.legal_indices(state)[0]
+        else:
+            action = best_action(statistics, board.current_player(state), settings['early_stop'] is not None)
+        if pondering:
+            next_state = board.next_state_index(state, action)
+            if board.outcome(next_state) is None:
+                self.ponder(board, next_state, **overrides)
+        return board.decode_action(action)
+
+    def ponder(self, board, state, **overrides):
+        """ Starts searching the state, the one after this bot's move, in a background thread until think or
+        stop_pondering is called, the pool is full or the tree stops growing (see ponder_idle). Its tree is reused
+        by the next search, from the opponent's move. The thread only gets the time the opponent leaves to other
+        threads, e.g. while waiting for input.
 
+        Args:
+            board:      The game setup.
+            state:      The state of the game.
+            overrides:  Values for any of the settings in setting_names; the limits are replaced.
+
+        """
+        self.stop_pondering()
+        settings = current_settings(**overrides)
+        overrides = dict(overrides, num_nodes=None, time_limit=None, node_limit=settings['pool_capacity'],
+                         early_stop=None, game_clock=None, reuse_tree=True)
+        self.halt = threading.Event()
+        self.ponderer = threading.Thread(target=self.search, args=(board, state), kwargs=overrides)
+        self.ponderer.daemon = True
+        self.ponderer.start()
+
+    def stop_pondering(self):
+        """ Stops the pondering search, if there is one, keeping its tree. """
+        if self.ponderer is not None:
+            self.halt.set()
+            self.ponderer.join()
+            self.ponderer = None
+            self.halt = None
+
+
+def best_action(statistics, identity, most_visited=False):
+    """ Picks the move to play from the statistics of the root's children.
+
+    Args:
+        statistics:     A list of (action, visits, wins) for the children of the root.
+        identity:       The bot's identity, either 1 or 2.
+        most_visited:   Pick the most visited child instead, e.g. after a search that may have stopped early.
+
+    Returns:    The compact action of the child with the best estimated win rate (or the most visits).
+
+    """
     # Return an action, typically the most frequently used action (from the root) or the action with the best
     # estimated win rate.
+    if most_visited:
+        return max(statistics, key=lambda entry: entry[1])[0]
     best_winrate = -inf
-    if identity_of_bot == 1:
-        sign = 1
-    else:
-        sign = -1
-    for action, child in root_node.child_nodes.items():
-        child_winrate = (child.wins/child.visits)*sign
+    sign = id_coeff[identity]
+    for action, visits, wins in statistics:
+        child_winrate = (wins/visits)*sign
         if child_winrate > best_winrate:
-            best_action = action
+            best = action
             best_winrate = child_winrate
 
     #I think this is ok to leave in? rollout_bot does something similar
-    #print("mcts vanilla #", identity_of_bot, "picking", best_action, "with winrate =", best_winrate)
-    return best_action
+    #print("mcts vanilla #", identity, "picking", best, "with winrate =", best_winrate)
+    return best
+
+
+# The engine behind this module's think(); other bots keep their own.
+engine = MCTSEngine()
+
+
+def think(board, state, **overrides):
+    """ Performs MCTS with this module's engine, see MCTSEngine.think. """
+    return engine.think(board, state, **overrides)
@@ -0,0 +1,161 @@
+import numpy as np
+import p3_t3
+
+# NumPy copies of the 9-bit lookup tables in p3_t3.
+win_table = np.array(p3_t3.win_table, dtype=bool)
+winnable_table = np.array(p3_t3.winnable_table, dtype=bool)
+threat_table = np.array(p3_t3.threat_table, dtype=np.int32)
+bit_counts = np.array(p3_t3.bit_counts, dtype=np.int32)
+# clear_squares[occupied]: which of the 9 squares are clear, as a (512, 9) bool array.
+clear_squares = np.array(
+    [[not occupied & (1 << i) for i in range(9)] for occupied in range(512)],
+    dtype=bool,
+)
+bits = (1 << np.arange(9)).astype(np.int32)
+
+
+class BatchGames(object):
+    """ N games stored as NumPy arrays of bitboards and advanced together one ply at a time.
+
+    pieces[n, p, B] is the 9-bit mask of player p + 1 in sub-board B, big[n, p] the big-board mask of player p + 1,
+    constraint[n] the required sub-board (-1 for any), player[n] the player to move minus one and points[n] the
+    points of player 1 once finished[n] is set. With close_dead, the games follow the rules of
+    p3_t3.Board(close_dead=True), and the dead sub-boards of the given states are closed first.
+    """
+
+    def __init__(self, states, close_dead=False):
+        states = list(states)
+        self.close_dead = close_dead
+        n = len(states)
+        self.pieces = np.array([state[:18] for state in states], dtype=np.int32).reshape(n, 9, 2).transpose(0, 2, 1).copy()
+        self.big = np.array([state[18:20] for state in states], dtype=np.int32).reshape(n, 2)
+        self.constraint = np.array(
+            [-1 if state[20] is None else 3 * state[20] + state[21] for state in states], dtype=np.int32)
+        self.player = np.array([state[22] - 1 for state in states], dtype=np.int32)
+        self.points = np.zeros(n, dtype=np.int32)
+        self.finished = np.zeros(n, dtype=bool)
+        self.plies = np.zeros(n, dtype=np.int32)
+        if close_dead:
+            dead = ~winnable_table[self.pieces[:, 0]] & ~winnable_table[self.pieces[:, 1]]
+            closed = (dead * bits).sum(axis=1).astype(np.int32)
+            self.big |= closed[:, None]
+            constrained = self.constraint >= 0
+            sent = np.zeros(n, dtype=bool)
+            sent[constrained] = ((self.big[constrained, 0] | self.big[constrained, 1]) &
+                                 bits[self.constraint[constrained]]) != 0
+            self.constraint[sent] = -1
+        self._score(np.arange(n))
+
+    def __len__(self):
+        return len(self.player)
+
+    def _score(self, live):
+        """ Marks the games in live that have ended and records their points. """
+        big1 = self.big[live, 0]
+        big2 = self.big[live, 1]
+        p1_won = win_table[big1 & ~big2]
+        p2_won = win_table[big2 & ~big1] & ~p1_won
+        drawn = ((big1 | big2) == 0x1ff) & ~p1_won & ~p2_won
+        if self.close_dead:
+            drawn |= ~winnable_table[big1] & ~winnable_table[big2] & ~p1_won & ~p2_won
+        self.points[live] = p1_won.astype(np.int32) - p2_won
+        self.finished[live] = p1_won | p2_won | drawn
+
+    def legal(self, live):
+        """ Returns the legal compact actions of the games in live as an (L, 81) bool array. """
+        occupied = self.pieces[live, 0] | self.pieces[live, 1]
+        finished = self.big[live, 0] | self.big[live, 1]
+        allowed = (finished[:, None] & bits) == 0
+        constraint = self.constraint[live]
+        constrained = constraint >= 0
+        allowed[constrained] = False
+        allowed[constrained, constraint[constrained]] = True
+        return (clear_squares[occupied] & allowed[:, :, None]).reshape(len(live), 81)
+
+    def apply(self, live, actions):
+        """ Plays one compact action in each of the games in live. """
+        B = actions // 9
+        cell = actions % 9
+        player = self.player[live]
+
+        updated = self.pieces[live, player, B] | bits[cell]
+        self.pieces[live, player, B] = updated
+        won = win_table[updated]
+        other = self.pieces[live, 1 - player, B]
+        self.big[live[won], player[won]] |= bits[B[won]]
+        if self.close_dead:
+            tied = ~winnable_table[updated] & ~winnable_table[other] & ~won
+        else:
+            tied = ((updated | other) == 0x1ff) & ~won
+        self.big[live[tied], 0] |= bits[B[tied]]
+        self.big[live[tied], 1] |= bits[B[tied]]
+
+        closed = ((self.big[live, 0] | self.big[live, 1]) & bits[cell]) != 0
+        self.constraint[live] = np.where(closed, -1, cell)
+        self.player[live] = 1 - player
+        self.plies[live] += 1
+        self._score(live)
+
+    def play(self, rng, max_plies=None):
+        """ Plays every unfinished game with uniformly random moves, until it ends or has made max_plies moves.
+
+        Returns:    The points of each game for player 1 (0 for games stopped before the end).
+        """
+        live = np.flatnonzero(~self.finished)
+        ply = 0
+        while len(live) and (max_plies is None or ply < max_plies):
+            legal = self.legal(live)
+            # The largest of uniform keys over the legal moves is a uniform pick.
+            keys = rng.random(legal.shape)
+            keys[~legal] = -1.
+            self.apply(live, keys.argmax(axis=1))
+            live = live[~self.finished[live]]
+            ply += 1
+        return self.points
+
+    def evaluate(self):
+        """ Returns the points of player 1 of the finished games and the estimate of p3_t3.Board.evaluate for the
+        others, as a float array. """
+        big1 = self.big[:, 0]
+        big2 = self.big[:, 1]
+        finished = big1 | big2
+        p1 = big1 & ~big2
+        p2 = big2 & ~big1
+        score = (p3_t3.eval_owned * (bit_counts[p1] - bit_counts[p2]) +
+                 p3_t3.eval_threats * (bit_counts[threat_table[p1] & ~finished] -
+                                       bit_counts[threat_table[p2] & ~finished]))
+        n = np.arange(len(self))
+        own = self.pieces[n, self.player]
+        clear = ~(self.pieces[:, 0] | self.pieces[:, 1]) & 0x1ff
+        allowed = (finished[:, None] & bits) == 0
+        constrained = self.constraint >= 0
+        allowed[constrained] = False
+        allowed[constrained, self.constraint[constrained]] = True
+        can_win = ((threat_table[own] & clear) != 0) & allowed
+        score += p3_t3.eval_mover * can_win.any(axis=1) * np.where(self.player == 0, 1, -1)
+        return np.where(self.finished, self.points, np.clip(score, -1., 1.))
+
+    def owned(self, player):
+        """ Returns how many sub-boards each game has won for player (1 or 2). """
+        mask = self.big[:, player - 1] & ~self.big[:, 2 - player]
+        return ((mask[:, None] & bits) != 0).sum(axis=1)
+
+
+_rng = np.random.default_rng()
+
+
+def batch_rollouts(states, rng=None, max_plies=None, close_dead=False):
+    """ Plays out each of the given states with uniformly random moves, all in lockstep.
+
+    Args:
+        states:     A sequence of state tuples (or MutableState fields lists).
+        rng:        A numpy Generator; a module-level one is used by default.
+        max_plies:  Stop each game after this many moves (None to play to the end).
+        close_dead: Play by the rules of p3_t3.Board(close_dead=True).
+
+    Returns:        A BatchGames holding the final positions; its points array has the player 1 points.
+
+    """
+    games = BatchGames(states, close_dead)
+    games.play(_rng if rng is None else rng, max_plies)
+    return games
@@ -0,0 +1,884 @@
+import sys
+import random
+from time import sleep
+from timeit import default_timer as time
+import p3_t3
+
+
+class ReferenceBoard(p3_t3.Board):
+    """ The board as it was before the lookup tables: every win check scans the eight lines. """
+
+    def next_state(self, state, action):
+        R, C, r, c = action
+        player = state[-1]
+        board_index = 2 * (3 * R + C)
+        player_index = player - 1
+
+        state = list(state)
+        state[-1] = 3 - player
+        state[board_index + player_index] |= p3_t3.positions[(r, c)]
+        updated_board = state[board_index + player_index]
+
+        full = (state[board_index] | state[board_index + 1] == 0x1ff)
+        if any(updated_board & w == w for w in self.wins):
+            state[18 + player_index] |= p3_t3.positions[(R, C)]
+        elif full:
+            state[18] |= p3_t3.positions[(R, C)]
+            state[19] |= p3_t3.positions[(R, C)]
+
+        if (state[18] | state[19]) & p3_t3.positions[(r, c)]:
+            state[20], state[21] = None, None
+        else:
+            state[20], state[21] = r, c
+
+        return tuple(state)
+
+    def is_ended(self, state):
+        p1 = state[18] & ~state[19]
+        p2 = state[19] & ~state[18]
+
+        if any(w & p1 == w for w in self.wins):
+            return True
+        if any(w & p2 == w for w in self.wins):
+            return True
+        if state[18] | state[19] == 0x1ff:
+            return True
+
+        return False
+
+    def points_values(self, state):
+        if not self.is_ended(state):
+            return
+        p1 = state[18] & ~state[19]
+        p2 = state[19] & ~state[18]
+
+        if any(w & p1 == w for w in self.wins):
+            return {1: 1, 2: -1}
+        if any(w & p2 == w for w in self.wins):
+            return {1: -1, 2: 1}
+        if state[18] | state[19] == 0x1ff:
+            return {1: 0, 2: 0}
+
+
+def random_games(board, games, seed):
+    """ Plays the given number of uniformly random games and returns the final states. """
+    rng = random.Random(seed)
+    finals = []
+    for _ in range(games):
+        state = board.starting_state()
+        while not board.is_ended(state):
+            state = board.next_state(state, rng.choice(board.legal_actions(state)))
+        finals.append(state)
+    return finals
+
+
+def bench_tables(games):
+    """ Times random games on the table-driven board against the line-scanning reference board. """
+    results = {}
+    for name, board in (('reference', ReferenceBoard()), ('tables', p3_t3.Board())):
+        start = time()
+        finals = random_games(board, games, seed=146)
+        results[name] = finals
+        elapsed = time() - start
+        print("%-10s %d games in %.3f s (%.0f games/s)" % (name, games, elapsed, games / elapsed))
+    if results['reference'] != results['tables']:
+        print("MISMATCH: the boards disagree on the same random games")
+        exit(1)
+    print("Both boards reached identical final states.")
+
+
+def random_games_compact(board, games, seed):
+    """ Like random_games, but on compact actions. """
+    rng = random.Random(seed)
+    finals = []
+    for _ in range(games):
+        state = board.starting_state()
+        while board.outcome(state) is None:
+            state = board.next_state_index(state, rng.choice(board.legal_indices(state)))
+        finals.append(state)
+    return finals
+
+
+def bench_actions(games):
+    """ Times random games with (R, C, r, c) actions against the same games with compact actions. """
+    board = p3_t3.Board()
+    results = {}
+    for name, play in (('tuples', random_games), ('compact', random_games_compact)):
+        start = time()
+        results[name] = play(board, games, seed=146)
+        elapsed = time() - start
+        print("%-10s %d games in %.3f s (%.0f games/s)" % (name, games, elapsed, games / elapsed))
+    if results['tuples'] != results['compact']:
+        print("MISMATCH: the action encodings disagree on the same random games")
+        exit(1)
+    print("Both encodings reached identical final states.")
+
+
+def bench_mutable(games):
+    """ Times random rollouts on state tuples against the same rollouts on a MutableState with apply/undo. """
+    board = p3_t3.Board()
+    results = {}
+
+    start = time()
+    rng = random.Random(146)
+    finals = []
+    for _ in range(games):
+        state = board.starting_state()
+        while board.outcome(state) is None:
+            state = board.next_state_index(state, rng.choice(board.legal_indices(state)))
+        finals.append(state)
+    results['tuples'] = finals
+    elapsed = time() - start
+    print("%-10s %d rollouts in %.3f s (%.0f rollouts/s)" % ('tuples', games, elapsed, games / elapsed))
+
+    start = time()
+    rng = random.Random(146)
+    finals = []
+    game = board.mutable_state(board.starting_state())
+    for _ in range(games):
+        while game.outcome() is None:
+            game.apply(rng.choice(game.legal_indices()))
+        finals.append(game.freeze())
+        game.rewind()
+    results['mutable'] = finals
+    elapsed = time() - start
+    print("%-10s %d rollouts in %.3f s (%.0f rollouts/s)" % ('mutable', games, elapsed, games / elapsed))
+
+    if results['tuples'] != results['mutable']:
+        print("MISMATCH: the state representations disagree on the same random games")
+        exit(1)
+    print("Both representations reached identical final states.")
+
+
+def bench_batch(games):
+    """ Times one-at-a-time random rollouts against p3_batch lockstep rollouts of the same number of games. """
+    import p3_batch
+    import numpy as np
+
+    board = p3_t3.Board()
+    start = time()
+    finals = random_games_compact(board, games, seed=146)
+    elapsed = time() - start
+    points = [board.outcome(state)[1] for state in finals]
+    print("%-10s %d rollouts in %.3f s (%.0f rollouts/s), mean points for player 1 %+.3f" % (
+        'python', games, elapsed, games / elapsed, sum(points) / float(games)))
+
+    for size in (32, 256, games):
+        rng = np.random.default_rng(146)
+        start = time()
+        points = []
+        for first in range(0, games, size):
+            batch = p3_batch.batch_rollouts([board.starting_state()] * min(size, games - first), rng)
+            points.extend(batch.points.tolist())
+        elapsed = time() - start
+        print("%-10s %d rollouts in %.3f s (%.0f rollouts/s), mean points for player 1 %+.3f" % (
+            'numpy/%d' % size, games, elapsed, games / elapsed, sum(points) / float(games)))
+
+
+def play_match(first, second, games, seed=146):
+    """ Plays games between two think functions, alternating who moves first.
+
+    Returns:    The number of games won by first, won by second, and drawn.
+
+    """
+    board = p3_t3.Board()
+    random.seed(seed)
+    results = [0, 0, 0]
+    for game in range(games):
+        players = (first, second) if game % 2 == 0 else (second, first)
+        state = board.starting_state()
+        while board.outcome(state) is None:
+            state = board.next_state(state, players[state[-1] - 1](board, state))
+        winner = board.outcome(state)
+        if winner is board.drawn:
+            results[2] += 1
+        elif (winner is board.p1_won) == (game % 2 == 0):
+            results[0] += 1
+        else:
+            results[1] += 1
+    return results
+
+
+def sample_positions(count, plies, seed=146):
+    """ Returns positions reached by playing the given number of random plies from the start. """
+    board = p3_t3.Board()
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        state = board.starting_state()
+        for _ in range(plies):
+            if board.outcome(state) is not None:
+                break
+            state = board.next_state_index(state, rng.choice(board.legal_indices(state)))
+        if board.outcome(state) is None:
+            positions.append(state)
+    return positions
+
+
+def time_think(think, positions, **settings):
+    """ Returns the seconds taken by think over all the positions. """
+    board = p3_t3.Board()
+    start = time()
+    for state in positions:
+        think(board, state, **settings)
+    return time() - start
+
+
+def bench_transpositions(games):
+    """ Compares mcts_vanilla with and without the transposition table, on speed and in a match. """
+    import mcts_vanilla
+
+    iterations = 1000
+    for plies in (0, 10, 30):
+        positions = sample_positions(5, plies)
+        plain = time_think(mcts_vanilla.think, positions, num_nodes=iterations)
+        shared = time_think(mcts_vanilla.think, positions, num_nodes=iterations, use_transpositions=True)
+        print("after %2d plies: %.0f iterations/s plain, %.0f with transpositions" % (
+            plies, len(positions) * iterations / plain, len(positions) * iterations / shared))
+
+    def with_table(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=iterations, use_transpositions=True)
+
+    def without_table(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=iterations)
+
+    won, lost, drawn = play_match(with_table, without_table, games)
+    print("transpositions vs plain, %d iterations each: %d won, %d lost, %d drawn" % (iterations, won, lost, drawn))
+
+
+def bench_symmetries(games):
+    """ Compares mcts_vanilla with and without symmetry merging on early positions and in a match. """
+    import mcts_vanilla
+
+    board = p3_t3.Board()
+    iterations = 1000
+    # Opening positions that keep some symmetry: the empty board and a centre opening.
+    for name, state in (('start', board.starting_state()),
+                        ('after 1 1 1 1', board.next_state(board.starting_state(), (1, 1, 1, 1)))):
+        moves = len(board.legal_indices(state))
+        distinct = len(board.symmetric_state(state).distinct_indices())
+        plain = time_think(mcts_vanilla.think, [state], num_nodes=iterations)
+        symmetric = time_think(mcts_vanilla.think, [state], num_nodes=iterations, use_symmetries=True)
+        print("%-14s %2d root moves, %2d distinct: %5.1f vs %5.1f iterations per root child, "
+              "%.0f vs %.0f iterations/s" % (
+                  name, moves, distinct, iterations / float(moves), iterations / float(distinct),
+                  iterations / plain, iterations / symmetric))
+
+    def with_symmetries(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=iterations, use_symmetries=True)
+
+    def without_symmetries(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=iterations)
+
+    won, lost, drawn = play_match(with_symmetries, without_symmetries, games)
+    print("symmetries vs plain, %d iterations each: %d won, %d lost, %d drawn" % (iterations, won, lost, drawn))
+
+
+def bench_reuse(games):
+    """ Compares mcts_vanilla with and without subtree reuse: root visits carried over between moves, and a match. """
+    import mcts_vanilla
+
+    board = p3_t3.Board()
+    iterations = 1000
+    reusing = mcts_vanilla.MCTSEngine()
+    carried = []
+    rng = random.Random(146)
+    for _ in range(10):
+        state = board.starting_state()
+        while board.outcome(state) is None:
+            if state[-1] == 1:
+                state = board.next_state(state, reusing.think(board, state, num_nodes=iterations, reuse_tree=True))
+                if board.outcome(state) is not None:
+                    break
+                # The root visits the next search starts from, out of the iterations it adds.
+                state = board.next_state_index(state, rng.choice(board.legal_indices(state)))
+                if board.outcome(state) is None:
+                    reusing.search(board, state, num_nodes=0, reuse_tree=True)
+                    carried.append(reusing.pool.visits[0])
+            else:
+                state = board.next_state_index(state, rng.choice(board.legal_indices(state)))
+    print("against random moves: %.0f root visits carried over per move on average (%d iterations per search)" % (
+        sum(carried) / float(len(carried)), iterations))
+
+    first = mcts_vanilla.MCTSEngine()
+    second = mcts_vanilla.MCTSEngine()
+
+    def with_reuse(board, state):
+        return first.think(board, state, num_nodes=iterations, reuse_tree=True)
+
+    def without_reuse(board, state):
+        return second.think(board, state, num_nodes=iterations)
+
+    won, lost, drawn = play_match(with_reuse, without_reuse, games)
+    print("reuse vs plain, %d iterations each: %d won, %d lost, %d drawn" % (iterations, won, lost, drawn))
+
+
+def bench_iterations(games):
+    """ Times mcts_vanilla iterations per second as the tree grows, from the start and from a midgame position. """
+    import mcts_vanilla
+
+    for plies in (0, 20):
+        positions = sample_positions(1, plies)
+        for iterations in (1000, 5000, 20000):
+            # The same rollouts every time, so that versions of the search build the same trees.
+            random.seed(146)
+            elapsed = time_think(mcts_vanilla.think, positions, num_nodes=iterations)
+            print("after %2d plies, %5d iterations: %.0f iterations/s" % (plies, iterations, iterations / elapsed))
+
+
+def bench_root_parallel(games):
+    """ Times mcts_parallel with 1 to 4 workers on the same positions, and plays it against mcts_vanilla. """
+    import mcts_vanilla
+    import mcts_parallel
+
+    iterations = 1000
+    positions = sample_positions(5, 10)
+    for size in (1, 2, 4):
+        mcts_parallel.think(p3_t3.Board(), positions[0], workers=size, num_nodes=1)  # start the workers
+        elapsed = time_think(mcts_parallel.think, positions, workers=size, num_nodes=iterations)
+        print("%d workers: %.0f iterations/s in total" % (size, size * iterations * len(positions) / elapsed))
+
+    def parallel(board, state):
+        return mcts_parallel.think(board, state, workers=4, num_nodes=iterations)
+
+    def single(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=iterations)
+
+    won, lost, drawn = play_match(parallel, single, games)
+    print("4 workers vs 1 process, %d iterations each: %d won, %d lost, %d drawn" % (iterations, won, lost, drawn))
+
+
+def bench_leaf_parallel(games):
+    """ Times leaf-parallel mcts_parallel with 1 to 4 workers, and plays it against mcts_vanilla. """
+    import mcts_vanilla
+    import mcts_parallel
+
+    iterations = 1000
+    positions = sample_positions(5, 10)
+    for size in (1, 2, 4):
+        mcts_parallel.think(p3_t3.Board(), positions[0], mode='leaf', workers=size, num_nodes=1)  # start the workers
+        elapsed = time_think(mcts_parallel.think, positions, mode='leaf', workers=size, num_nodes=iterations,
+                             leaf_batch=16)
+        print("%d workers, batches of 16: %.0f iterations/s" % (size, iterations * len(positions) / elapsed))
+
+    def parallel(board, state):
+        return mcts_parallel.think(board, state, mode='leaf', workers=4, num_nodes=iterations, leaf_batch=16)
+
+    def single(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=iterations)
+
+    won, lost, drawn = play_match(parallel, single, games)
+    print("leaf batches of 16 on 4 workers vs 1 process, %d iterations each: %d won, %d lost, %d drawn" % (
+        iterations, won, lost, drawn))
+
+
+def bench_tree_parallel(games):
+    """ Times tree-parallel mcts_parallel with 1 to 4 workers, and plays it against mcts_vanilla. """
+    import mcts_vanilla
+    import mcts_parallel
+
+    iterations = 1000
+    positions = sample_positions(5, 10)
+    for size in (1, 2, 4):
+        mcts_parallel.think(p3_t3.Board(), positions[0], mode='tree', workers=size, num_nodes=size)  # start the workers
+        elapsed = time_think(mcts_parallel.think, positions, mode='tree', workers=size, num_nodes=iterations)
+        print("%d workers: %.0f iterations/s" % (size, iterations * len(positions) / elapsed))
+
+    def parallel(board, state):
+        return mcts_parallel.think(board, state, mode='tree', workers=4, num_nodes=iterations)
+
+    def single(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=iterations)
+
+    won, lost, drawn = play_match(parallel, single, games)
+    print("one tree on 4 workers vs 1 process, %d iterations each: %d won, %d lost, %d drawn" % (
+        iterations, won, lost, drawn))
+
+
+def bench_budget(games):
+    """ Measures how far time-limited searches run past their limit, what reading the clock costs, and that an
+    interrupted search still returns a move. """
+    import signal
+    import mcts_vanilla
+
+    board = p3_t3.Board()
+    positions = sample_positions(games // 100 + 5, 10)
+    engine = mcts_vanilla.MCTSEngine()
+    engine.search(board, positions[0], num_nodes=1)  # allocate the pools, which the first search would pay for
+    for limit in (0.02, 0.1, 0.5):
+        overshoots = []
+        for state in positions:
+            engine.search(board, state, num_nodes=None, time_limit=limit)
+            overshoots.append(engine.budget.overshoot())
+        print("time limit %.2f s: overshoot mean %.2f ms, max %.2f ms (bound %.1f ms)" % (
+            limit, 1000 * sum(overshoots) / len(overshoots), 1000 * max(overshoots),
+            1000 * mcts_vanilla.max_overshoot))
+
+    # The same searches by iteration count, with and without a time limit that is never reached.
+    random.seed(146)
+    by_count = time_think(engine.search, positions, num_nodes=2000)
+    random.seed(146)
+    by_clock = time_think(engine.search, positions, num_nodes=2000, time_limit=1000.)
+    print("2000 iterations: %.0f iterations/s without a time limit, %.0f with one" % (
+        2000 * len(positions) / by_count, 2000 * len(positions) / by_clock))
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGALRM, interrupt)
+    signal.setitimer(signal.ITIMER_REAL, 0.1)
+    action = engine.think(board, positions[0], num_nodes=None, time_limit=10.)
+    print("interrupted after %d iterations, picked legal move %s: %s" % (
+        engine.budget.iterations, action, board.is_legal(positions[0], action)))
+
+
+def bench_early_stop(games):
+    """ Plays mcts_vanilla with early stopping against it without, first on equal iteration budgets, counting the
+    iterations saved, then on equal game clocks, where the saved time goes to later moves. """
+    import mcts_vanilla
+
+    iterations = 2000
+    for rule in ('certain', 'confident'):
+        stopping = mcts_vanilla.MCTSEngine()
+        plain = mcts_vanilla.MCTSEngine()
+        saved = []
+
+        def early(board, state):
+            action = stopping.think(board, state, num_nodes=iterations, early_stop=rule)
+            saved.append(iterations - stopping.budget.iterations)
+            return action
+
+        def full(board, state):
+            return plain.think(board, state, num_nodes=iterations)
+
+        won, lost, drawn = play_match(early, full, games)
+        print("%-9s vs plain, %d iterations: %.0f iterations saved per move (%.0f%%); %d won, %d lost, %d drawn" % (
+            rule, iterations, sum(saved) / float(len(saved)), 100. * sum(saved) / len(saved) / iterations,
+            won, lost, drawn))
+
+    seconds = 10.
+    clocks = {}
+    counts = {'early': [], 'plain': []}
+
+    def timed(name, engine, **settings):
+        def think(board, state):
+            if sum(bin(mask).count('1') for mask in state[:18]) <= 1:
+                clocks[name] = mcts_vanilla.GameClock(seconds)  # a new game
+            action = engine.think(board, state, num_nodes=None, game_clock=clocks[name], **settings)
+            counts[name].append(engine.budget.iterations)
+            return action
+        return think
+
+    won, lost, drawn = play_match(timed('early', mcts_vanilla.MCTSEngine(), early_stop='confident'),
+                                  timed('plain', mcts_vanilla.MCTSEngine()), games)
+    print("confident vs plain, %.0f s per game each: %.0f vs %.0f iterations per move; %d won, %d lost, %d drawn" % (
+        seconds, sum(counts['early']) / float(len(counts['early'])), sum(counts['plain']) / float(len(counts['plain'])),
+        won, lost, drawn))
+
+
+def bench_ponder(games):
+    """ Plays mcts_vanilla against a slow random opponent, standing in for a human, with and without pondering,
+    and counts the root visits each search starts from. """
+    import mcts_vanilla
+
+    board = p3_t3.Board()
+    iterations = 1000
+    delay = 0.5
+    for name, settings in (('reuse only', dict(reuse_tree=True)), ('pondering', dict(ponder=True))):
+        engine = mcts_vanilla.MCTSEngine()
+        carried = []
+        thinking = []
+        rng = random.Random(146)
+        for _ in range(max(games // 100, 3)):
+            state = board.starting_state()
+            while board.outcome(state) is None:
+                if state[-1] == 1:
+                    # take over the tree at the opponent's move, as think would, to count its visits
+                    engine.stop_pondering()
+                    engine.search(board, state, num_nodes=0, reuse_tree=True)
+                    carried.append(engine.pool.visits[0])
+                    start = time()
+                    state = board.next_state(state, engine.think(board, state, num_nodes=iterations, **settings))
+                    thinking.append(time() - start)
+                else:
+                    sleep(delay)
+                    state = board.next_state_index(state, rng.choice(board.legal_indices(state)))
+            engine.stop_pondering()
+        print("%-10s opponent taking %.1f s: searches start from %.0f root visits on average, "
+              "%.0f ms per move" % (name, delay, sum(carried) / float(len(carried)),
+                                    1000 * sum(thinking) / len(thinking)))
+
+
+def bench_solver(games):
+    """ Compares mcts_vanilla with and without the solver on endgame positions and in a match. """
+    import mcts_vanilla
+    from mcts_node import unproven
+
+    board = p3_t3.Board()
+    iterations = 3000
+    positions = sample_positions(20, 45)
+    for solver in (False, True):
+        engine = mcts_vanilla.MCTSEngine()
+        done = revisits = solved = 0
+        start = time()
+        for state in positions:
+            engine.search(board, state, num_nodes=iterations, solver=solver)
+            pool = engine.pool
+            done += engine.budget.iterations
+            # every visit to a finished game after the one that expanded it is a wasted simulation
+            revisits += sum(pool.visits[node] - 1 for node in range(pool.size) if pool.action_count[node] == 0)
+            solved += pool.proven[0] != unproven
+        print("solver %-5s after 45 plies: %d iterations, %d of them revisiting finished games, %d of %d roots "
+              "proven, %.1f s" % (solver, done, revisits, solved, len(positions), time() - start))
+
+    def with_solver(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=1000, solver=True)
+
+    plain = mcts_vanilla.MCTSEngine()
+
+    def without_solver(board, state):
+        return plain.think(board, state, num_nodes=1000)
+
+    won, lost, drawn = play_match(with_solver, without_solver, games)
+    print("solver vs plain, 1000 iterations each: %d won, %d lost, %d drawn" % (won, lost, drawn))
+
+
+def bench_rave(games):
+    """ Compares mcts_vanilla with and without RAVE in speed and in matches at equal iterations and equal time. """
+    import mcts_vanilla
+
+    board = p3_t3.Board()
+    positions = sample_positions(20, 10)
+    engines = dict((rave, mcts_vanilla.MCTSEngine()) for rave in (False, True))
+    for rave, engine in engines.items():
+        seconds = time_think(engine.search, positions, num_nodes=1000, rave=rave)
+        print("rave %-5s: %.0f iterations/s" % (rave, 1000 * len(positions) / seconds))
+
+    for settings, label in ((dict(num_nodes=500), "500 iterations"),
+                            (dict(num_nodes=None, time_limit=0.1), "0.1 s")):
+        def with_rave(board, state):
+            return engines[True].think(board, state, rave=True, **settings)
+
+        def without_rave(board, state):
+            return engines[False].think(board, state, **settings)
+
+        won, lost, drawn = play_match(with_rave, without_rave, games)
+        print("rave vs plain, %s a move: %d won, %d lost, %d drawn" % (label, won, lost, drawn))
+
+
+def bench_rollout_policy(games):
+    """ Compares random and informed rollouts in speed, length and results, and in the bots that use them. """
+    import io
+    import contextlib
+    import mcts_vanilla
+    import rollout_bot
+
+    board = p3_t3.Board()
+    state = board.mutable_state(board.starting_state())
+    for policy in ('random', 'informed'):
+        random.seed(146)
+        plies = points = 0
+        start = time()
+        for _ in range(games):
+            state.load(board.starting_state())
+            points += mcts_vanilla.rollout(board, state, policy)
+            plies += state.plies()
+        elapsed = time() - start
+        print("%-8s %d rollouts in %.3f s (%.0f rollouts/s, %.0f plies/s), %.1f plies each, mean points for "
+              "player 1 %+.3f" % (policy, games, elapsed, games / elapsed, plies / elapsed, plies / float(games),
+                                  points / float(games)))
+
+    match_games = max(games // 50, 2)
+    engines = dict((policy, mcts_vanilla.MCTSEngine()) for policy in ('random', 'informed'))
+    for settings, label in ((dict(num_nodes=500), "500 iterations"),
+                            (dict(num_nodes=None, time_limit=0.1), "0.1 s")):
+        def informed(board, state):
+            return engines['informed'].think(board, state, rollout_policy='informed', **settings)
+
+        def uniform(board, state):
+            return engines['random'].think(board, state, **settings)
+
+        won, lost, drawn = play_match(informed, uniform, match_games)
+        print("mcts_vanilla informed vs random rollouts, %s a move: %d won, %d lost, %d drawn" % (
+            label, won, lost, drawn))
+
+    def rollout_think(policy):
+        def think(board, state):
+            rollout_bot.ROLLOUT_POLICY = policy
+            with contextlib.redirect_stdout(io.StringIO()):
+                return rollout_bot.think(board, state)
+        return think
+
+    won, lost, drawn = play_match(rollout_think('informed'), rollout_think('random'), match_games)
+    rollout_bot.ROLLOUT_POLICY = 'random'
+    print("rollout_bot informed vs random rollouts: %d won, %d lost, %d drawn" % (won, lost, drawn))
+
+
+def bench_endgame(games):
+    """ Reports how many late positions the alpha-beta endgame solver solves within a node limit, at what speed,
+    and plays mcts_vanilla with and without it. """
+    import mcts_vanilla
+    import p3_solve
+
+    board = p3_t3.Board()
+    max_nodes = 200000
+    print("empties positions solved  mean nodes  nodes/s")
+    positions = sample_positions(100, 40) + sample_positions(100, 50, seed=147) + sample_positions(100, 60, seed=148)
+    for low, high in ((0, 8), (9, 12), (13, 16), (17, 20), (21, 81)):
+        group = [state for state in positions if low <= p3_solve.empties(state) <= high]
+        if not group:
+            continue
+        solved = nodes = 0
+        start = time()
+        for state in group:
+            # a fresh table per position, so that each solve is measured on its own
+            solver = p3_solve.EndgameSolver(board)
+            solved += solver.solve(state, max_nodes) is not None
+            nodes += solver.nodes
+        elapsed = time() - start
+        print("%2d-%-4d %9d %6d  %10.0f  %7.0f" % (low, high, len(group), solved, nodes / float(len(group)),
+                                                   nodes / elapsed))
+
+    def with_endgame(board, state):
+        return mcts_vanilla.think(board, state, num_nodes=1000, solver=True, endgame_empties=20)
+
+    plain = mcts_vanilla.MCTSEngine()
+
+    def without_endgame(board, state):
+        return plain.think(board, state, num_nodes=1000)
+
+    won, lost, drawn = play_match(with_endgame, without_endgame, max(games // 50, 2))
+    print("endgame solver (20 empties) vs plain, 1000 iterations each: %d won, %d lost, %d drawn" % (
+        won, lost, drawn))
+
+
+def bench_dead_boards(games):
+    """ Compares random rollouts by the standard rules and with dead sub-boards closed, checks the dead-board
+    rules against the exact values of the standard rules, and plays mcts_vanilla with both kinds of rollouts. """
+    import mcts_vanilla
+    import p3_solve
+
+    standard = p3_t3.Board()
+    dead = p3_t3.Board(close_dead=True)
+    for rules in (standard, dead):
+        # fill the outcome caches, which the two rules do not share
+        random_games(rules, 200, 147)
+    for rules, name in ((standard, 'standard'), (dead, 'dead')):
+        random.seed(146)
+        state = rules.mutable_state(rules.starting_state())
+        plies = 0
+        results = [0, 0, 0]
+        start = time()
+        for _ in range(games):
+            state.load(rules.starting_state())
+            points = mcts_vanilla.rollout(rules, state)
+            plies += state.plies()
+            results[points] += 1
+        elapsed = time() - start
+        print("%-8s %d rollouts in %.3f s (%.0f rollouts/s), %.1f plies each, player 1 won %.3f, player 2 won "
+              "%.3f, drawn %.3f" % (name, games, elapsed, games / elapsed, plies / float(games),
+                                    results[1] / float(games), results[-1] / float(games), results[0] / float(games)))
+
+    # The early draw is exact: a standard game that nobody can win any more ends drawn.
+    random.seed(146)
+    early = saved = 0
+    for _ in range(games):
+        state = standard.starting_state()
+        drawn_at = None
+        ply = 0
+        while standard.outcome(state) is None:
+            if drawn_at is None and dead.outcome(state) is dead.drawn:
+                drawn_at = ply
+            state = standard.next_state_index(state, random.choice(standard.legal_indices(state)))
+            ply += 1
+        if drawn_at is not None:
+            assert standard.outcome(state) is standard.drawn
+            early += 1
+            saved += ply - drawn_at
+    print("early draws: %d of %d standard games, all drawn at the end, %.1f plies before it" % (
+        early, games, saved / float(max(early, 1))))
+
+    # Closing dead sub-boards changes where the next player may move, so exact values can differ.
+    positions = [state for state in sample_positions(300, 50) if p3_solve.empties(state) <= 16]
+    agree = 0
+    for state in positions:
+        fields = list(state)
+        dead.close_dead_boards(fields)
+        if p3_solve.EndgameSolver(standard).solve(state)[0] == p3_solve.EndgameSolver(dead).solve(fields)[0]:
+            agree += 1
+    print("exact values: the dead-board rules agree with the standard rules on %d of %d positions with at most "
+          "16 empties" % (agree, len(positions)))
+
+    engines = dict((closed, mcts_vanilla.MCTSEngine()) for closed in (False, True))
+    for settings, label in ((dict(num_nodes=500), "500 iterations"),
+                            (dict(num_nodes=None, time_limit=0.1), "0.1 s")):
+        def with_dead(board, state):
+            return engines[True].think(board, state, dead_boards=True, **settings)
+
+        def without_dead(board, state):
+            return engines[False].think(board, state, **settings)
+
+        won, lost, drawn = play_match(with_dead, without_dead, max(games // 50, 2))
+        print("dead-board rollouts vs standard rollouts, %s a move: %d won, %d lost, %d drawn" % (
+            label, won, lost, drawn))
+
+
+def bench_ordering(games):
+    """ Shows which moves a short search expands with and without move ordering and progressive widening, and
+    plays them against mcts_vanilla's defaults at equal time. """
+    import mcts_vanilla
+
+    board = p3_t3.Board()
+    variants = (("board order", dict()),
+                ("ordered", dict(move_ordering=True)),
+                ("ordered, widening 3", dict(move_ordering=True, widening_base=3.)))
+    positions = sample_positions(20, 6)
+    for name, settings in variants:
+        engine = mcts_vanilla.MCTSEngine()
+        engine.search(board, board.starting_state(), num_nodes=60, **settings)
+        expanded = [action for action, visits, wins in engine.root_statistics()]
+        kinds = [sum(1 for action in expanded if p3_t3.index_cells[action] in cells) for cells in
+                 ((0, 2, 6, 8), (1, 3, 5, 7), (4,))]
+        depth = nodes = 0
+        for state in positions:
+            engine.search(board, state, num_nodes=2000, **settings)
+            pool = engine.pool
+            for node in range(pool.size):
+                while pool.parent[node] >= 0:
+                    node = pool.parent[node]
+                    depth += 1
+            nodes += pool.size
+        print("%-20s 60 iterations from the start expand %d root moves (%d corner, %d edge, %d centre squares); "
+              "mean node depth of 2000-iteration trees %.2f" % (name, len(expanded), kinds[0], kinds[1], kinds[2],
+                                                                 depth / float(nodes)))
+
+    plain = mcts_vanilla.MCTSEngine()
+    for name, settings in variants[1:]:
+        engine = mcts_vanilla.MCTSEngine()
+
+        def ordered(board, state):
+            return engine.think(board, state, num_nodes=None, time_limit=0.1, **settings)
+
+        def unordered(board, state):
+            return plain.think(board, state, num_nodes=None, time_limit=0.1)
+
+        won, lost, drawn = play_match(ordered, unordered, max(games // 50, 2))
+        print("%s vs board order, 0.1 s a move: %d won, %d lost, %d drawn" % (name, won, lost, drawn))
+
+
+def bench_rollout_depth(games):
+    """ Compares rollouts cut off after a few plies and scored by Board.evaluate with full rollouts, in
+    simulations per second and in mcts_vanilla's strength at equal time. """
+    import mcts_vanilla
+
+    board = p3_t3.Board()
+    positions = sample_positions(100, 10)
+    state = board.mutable_state(board.starting_state())
+    depths = (None, 30, 20, 10, 5)
+    for depth in depths:
+        random.seed(146)
+        simulations = games * 5
+        start = time()
+        for simulation in range(simulations):
+            state.load(positions[simulation % len(positions)])
+            mcts_vanilla.rollout(board, state, rollout_depth=depth)
+        elapsed = time() - start
+        print("rollout_depth %-4s %.0f simulations/s" % (depth, simulations / elapsed))
+
+    plain = mcts_vanilla.MCTSEngine()
+    for depth in depths[2:4]:
+        engine = mcts_vanilla.MCTSEngine()
+
+        def cut_off(board, state):
+            return engine.think(board, state, num_nodes=None, time_limit=0.1, rollout_depth=depth)
+
+        def full(board, state):
+            return plain.think(board, state, num_nodes=None, time_limit=0.1)
+
+        won, lost, drawn = play_match(cut_off, full, max(games // 50, 2))
+        print("rollout_depth %d vs full rollouts, 0.1 s a move: %d won, %d lost, %d drawn" % (depth, won, lost, drawn))
+
+
+def bench_value(games):
+    """ Trains a linear and an MLP value function on random games, reports their fit and speed, and plays
+    mcts_vanilla scoring leaves with them against mcts_vanilla with rollouts at equal time. """
+    import os
+    import tempfile
+    import numpy as np
+    import mcts_vanilla
+    import p3_value
+
+    board = p3_t3.Board()
+    rng = np.random.default_rng(146)
+    inputs, targets = p3_value.random_game_examples(games * 5, rng=random.Random(146))
+    test_inputs, test_targets = p3_value.random_game_examples(1000, rng=random.Random(147))
+    print("%d training positions; predicting the mean, the test error is %.4f" % (
+        len(targets), ((test_targets - targets.mean()) ** 2).mean()))
+    positions = sample_positions(256, 20)
+    directory = tempfile.mkdtemp()
+    files = []
+    for hidden in ((), (32,)):
+        network = p3_value.ValueFunction(hidden, rng)
+        start = time()
+        network.train(inputs, targets, rng=rng)
+        trained = time() - start
+        error = ((network.forward(test_inputs)[-1][:, 0] - test_targets) ** 2).mean()
+        start = time()
+        for first in range(0, len(positions), 16):
+            network.evaluate(positions[first:first + 16])
+        batched = len(positions) / (time() - start)
+        start = time()
+        for state in positions:
+            network.evaluate([state])
+        single = len(positions) / (time() - start)
+        path = os.path.join(directory, 'value%s.npz' % len(hidden))
+        network.save(path)
+        files.append((hidden, path))
+        print("hidden %-6s trained in %.1f s, test error %.4f, %.0f leaves/s in batches of 16, %.0f one at a time" % (
+            hidden, trained, error, batched, single))
+
+    plain = mcts_vanilla.MCTSEngine()
+    for hidden, path in files:
+        engine = mcts_vanilla.MCTSEngine()
+
+        def valued(board, state):
+            return engine.think(board, state, num_nodes=None, time_limit=0.1, value_function=path, leaf_batch=16)
+
+        def rollouts(board, state):
+            return plain.think(board, state, num_nodes=None, time_limit=0.1)
+
+        won, lost, drawn = play_match(valued, rollouts, max(games // 50, 2))
+        print("hidden %-6s value function vs rollouts, 0.1 s a move: %d won, %d lost, %d drawn" % (
+            hidden, won, lost, drawn))
+
+
+benchmarks = dict(
+    tables=bench_tables,
+    actions=bench_actions,
+    mutable=bench_mutable,
+    batch=bench_batch,
+    transpositions=bench_transpositions,
+    symmetries=bench_symmetries,
+    reuse=bench_reuse,
+    iterations=bench_iterations,
+    root_parallel=bench_root_parallel,
+    leaf_parallel=bench_leaf_parallel,
+    tree_parallel=bench_tree_parallel,
+    budget=bench_budget,
+    early_stop=bench_early_stop,
+    ponder=bench_ponder,
+    solver=bench_solver,
+    rave=bench_rave,
+    rollout_policy=bench_rollout_policy,
+    endgame=bench_endgame,
+    dead_boards=bench_dead_boards,
+    ordering=bench_ordering,
+    rollout_depth=bench_rollout_depth,
+    value=bench_value,
+)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print("Need a benchmark name: " + ", ".join(benchmarks.keys()))
+        exit(1)
+    games = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    benchmarks[sys.argv[1]](games)
@@ -0,0 +1,132 @@
+from p3_t3 import threat_table, clear_cells, board_moves
+
+# Kinds of value stored in the transposition table: the exact value, or a bound
+# from an alpha-beta cutoff.
+exact = 0
+lower_bound = 1
+upper_bound = 2
+
+
+class SolveAborted(Exception):
+    """ Raised inside a solve that has searched more nodes than it was allowed. """
+
+
+def empties(state):
+    """ Returns the number of clear squares in the sub-boards that are still open. """
+    finished = state[18] | state[19]
+    return sum(len(clear_cells[state[2 * B] | state[2 * B + 1]]) for B in clear_cells[finished])
+
+
+def ordered_moves(state, first=None):
+    """ Returns the legal compact actions in the order the solver tries them: first (e.g. the best move of an
+    earlier search) if given, then the moves that win a sub-board, then those that block a sub-board win of the
+    opponent, then the rest.
+    """
+    mine = state[22] - 1
+    if state[20] is None:
+        boards = clear_cells[state[18] | state[19]]
+    else:
+        boards = (3 * state[20] + state[21],)
+    wins = []
+    blocks = []
+    rest = []
+    for B in boards:
+        own = state[2 * B + mine]
+        other = state[2 * B + 1 - mine]
+        clear = ~(own | other) & 0x1ff
+        winning = threat_table[own] & clear
+        blocking = threat_table[other] & clear & ~winning
+        wins += board_moves[B][0x1ff ^ winning]
+        blocks += board_moves[B][0x1ff ^ blocking]
+        rest += board_moves[B][0x1ff ^ clear | winning | blocking]
+    moves = wins + blocks + rest
+    if first is not None:
+        moves.remove(first)
+        moves.insert(0, first)
+    return moves
+
+
+class EndgameSolver(object):
+    """ Finds the exact value of a position by negamax search with alpha-beta pruning.
+
+    Values are the points of the player to move: 1, 0 or -1. Positions are looked up by Zobrist hash in a
+    transposition table of (value, kind, best action) entries, kept between solves since a position's value
+    never changes. The table is emptied once it holds table_size positions.
+    """
+
+    def __init__(self, board, table_size=1000000):
+        self.board = board
+        self.table = {}
+        self.table_size = table_size
+        self.nodes = 0
+        self.node_limit = None
+
+    def solve(self, state, max_nodes=None):
+        """ Solves a position.
+
+        Args:
+            state:      The state of the game.
+            max_nodes:  Give up after searching this many positions (None for no limit).
+
+        Returns:    The value and the best compact action (None if the game is over), or None if given up.
+
+        """
+        if len(self.table) >= self.table_size:
+            self.table.clear()
+        game = self.board.hashed_state(tuple(state))
+        self.node_limit = None if max_nodes is None else self.nodes + max_nodes
+        try:
+            value = self.negamax(game, -1, 1)
+        except SolveAborted:
+            return None
+        entry = self.table.get(game.hash)
+        return value, entry[2] if entry is not None else None
+
+    def negamax(self, game, alpha, beta):
+        """ Returns the value of the position of a HashedState if it is within (alpha, beta), else a bound on the
+        side of the window it is on. The state is left as it was. """
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SolveAborted()
+        fields = game.fields
+        outcome = self.board.outcome(fields)
+        if outcome is not None:
+            return outcome[fields[22]]
+
+        key = game.hash
+        entry = self.table.get(key)
+        first = None
+        window_alpha = alpha
+        if entry is not None:
+            value, kind, first = entry
+            if kind == exact:
+                return value
+            if kind == lower_bound:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        best = -2
+        best_action = None
+        for index in ordered_moves(fields, first):
+            game.apply(index)
+            value = -self.negamax(game, -beta, -alpha)
+            game.undo()
+            if value > best:
+                best = value
+                best_action = index
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if best <= window_alpha:
+            kind = upper_bound
+        elif best >= beta:
+            kind = lower_bound
+        else:
+            kind = exact
+        self.table[key] = (best, kind, best_action)
+        return best
@@ -18,6 +18,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import random
+
 num_players = 2
 
 positions = dict(
@@ -30,17 +32,146 @@ inv_positions = dict(
     (v, P) for P, v in positions.items()
 )
 
-class Board(object):
-    wins = [
-        positions[(r, 0)] | positions[(r, 1)] | positions[(r, 2)]
-        for r in range(3)
-    ] + [
-        positions[(0, c)] | positions[(1, c)] | positions[(2, c)]
-        for c in range(3)
-    ] + [
-        positions[(0, 0)] | positions[(1, 1)] | positions[(2, 2)],
-        positions[(0, 2)] | positions[(1, 1)] | positions[(2, 0)],
+win_lines = [
+    positions[(r, 0)] | positions[(r, 1)] | positions[(r, 2)]
+    for r in range(3)
+] + [
+    positions[(0, c)] | positions[(1, c)] | positions[(2, c)]
+    for c in range(3)
+] + [
+    positions[(0, 0)] | positions[(1, 1)] | positions[(2, 2)],
+    positions[(0, 2)] | positions[(1, 1)] | positions[(2, 0)],
+]
+
+# Lookup tables indexed by a 9-bit mask of a sub-board or of the big board,
+# so that win and terminal checks are a single list index.
+#   win_table[mask]:      mask contains a complete line.
+#   full_table[mask]:     all nine squares are set.
+#   winnable_table[mask]: some line has no square in mask, i.e. a player
+#                         whose opponent holds mask can still complete it.
+#                         So winnable_table[O] is "still winnable by X" and
+#                         winnable_table[X] "still winnable by O"; a board
+#                         where both are false is dead (see Board).
+win_table = [
+    any(mask & w == w for w in win_lines) for mask in range(512)
+]
+full_table = [mask == 0x1ff for mask in range(512)]
+winnable_table = [
+    any(mask & w == 0 for w in win_lines) for mask in range(512)
+]
+#   threat_table[mask]:   the squares outside mask that would complete a
+#                         line for its owner, as a 9-bit mask.
+threat_table = [
+    sum(1 << i for i in range(9) if not mask & (1 << i) and win_table[mask | (1 << i)])
+    for mask in range(512)
+]
+#   clear_cells[mask]:    the squares not in mask, lowest first.
+clear_cells = [
+    tuple(i for i in range(9) if not mask & (1 << i)) for mask in range(512)
+]
+#   bit_counts[mask]:     the number of squares in mask.
+bit_counts = [bin(mask).count('1') for mask in range(512)]
+
+# Weights of Board.evaluate, fitted by least squares to the results of random
+# games: per sub-board owned, per open two-in-a-row on the big board, and for
+# the player to move having a sub-board win available.
+eval_owned = 0.05
+eval_threats = 0.19
+eval_mover = 0.07
+
+# Compact actions: the action (R, C, r, c) as the single cell index
+# 9 * (3 * R + C) + (3 * r + c), from 0 to 80. A set of compact actions
+# is an 81-bit mask with the bit of each index set.
+index_actions = [
+    (R, C, r, c)
+    for R in range(3)
+    for C in range(3)
+    for r in range(3)
+    for c in range(3)
+]
+
+action_indices = dict(
+    (action, index) for index, action in enumerate(index_actions)
+)
+
+# board_moves[B][occupied]: the compact actions on the clear squares of
+# sub-board B (3 * R + C) when its occupied squares are the 9-bit mask.
+board_moves = [
+    [
+        tuple(9 * B + i for i in range(9) if not occupied & (1 << i))
+        for occupied in range(512)
     ]
+    for B in range(9)
+]
+
+# Sub-board and square of each compact action, and the constraint (row and
+# column of the next required sub-board) that playing each square sends.
+index_boards = [index // 9 for index in range(81)]
+index_cells = [index % 9 for index in range(81)]
+cell_rows = [cell // 3 for cell in range(9)]
+cell_cols = [cell % 3 for cell in range(9)]
+
+# Zobrist keys for hashing states: a 64-bit key per player and compact action,
+# indexed zobrist_pieces[player][index], and one per constraint, indexed by the
+# required sub-board (9 for none). Every move switches the player to move, so
+# the side-to-move key is folded into the piece keys. The seed is fixed so that
+# hashes agree between runs and between processes.
+_zobrist_random = random.Random(146)
+zobrist_side = _zobrist_random.getrandbits(64)
+zobrist_pieces = [None] + [
+    [_zobrist_random.getrandbits(64) ^ zobrist_side for index in range(81)]
+    for player in (1, 2)
+]
+zobrist_constraints = [_zobrist_random.getrandbits(64) for B in range(10)]
+
+# The 8 symmetries of the square (identity, three rotations and four
+# reflections) as permutations of the squares 3 * r + c. Each one applies to
+# the big board and to every sub-board at once, and to the constraint.
+def _symmetric_square(symmetry, r, c):
+    """ Returns the square 3 * r + c moves to under the given symmetry. """
+    r, c = ((r, c), (c, 2 - r), (2 - r, 2 - c), (2 - c, r),
+            (r, 2 - c), (2 - r, c), (c, r), (2 - c, 2 - r))[symmetry]
+    return 3 * r + c
+
+symmetry_cells = [
+    [_symmetric_square(k, r, c) for r in range(3) for c in range(3)]
+    for k in range(8)
+]
+# symmetry_masks[k][mask]: a 9-bit mask with symmetry k applied.
+symmetry_masks = [
+    [sum(1 << cells[i] for i in range(9) if mask & (1 << i)) for mask in range(512)]
+    for cells in symmetry_cells
+]
+# symmetry_actions[k][index]: a compact action with symmetry k applied.
+symmetry_actions = [
+    [9 * cells[index // 9] + cells[index % 9] for index in range(81)]
+    for cells in symmetry_cells
+]
+# Zobrist keys of the transformed state, so that the hash of symmetry k of a
+# state can be kept up to date as moves are played on the untransformed one.
+zobrist_symmetric_pieces = [
+    [None] + [[zobrist_pieces[player][actions[index]] for index in range(81)] for player in (1, 2)]
+    for actions in symmetry_actions
+]
+zobrist_symmetric_constraints = [
+    [zobrist_constraints[B] for B in cells] + [zobrist_constraints[9]]
+    for cells in symmetry_cells
+]
+
+
+class Board(object):
+    """ The rules of the game. With close_dead, a sub-board that neither player can win any more is closed as a
+    tie at once instead of once it is full, and the game is drawn as soon as neither player can complete a line
+    of the big board. A dead sub-board then sends the next player anywhere, so this changes the game, unlike the
+    early draw; the standard rules are the default.
+    """
+    wins = win_lines
+
+    def __init__(self, close_dead=False):
+        self.close_dead = close_dead
+        if close_dead:
+            # the early draws are not outcomes of the standard rules
+            self._outcome_cache = {}
 
     def starting_state(self):
         # Each of the 9 pairs of player 1 and player 2 board bitmasks
@@ -175,6 +306,8 @@ class Board(object):
         return R, C, r, c
 
     def unpack_action(self, action):
+        if isinstance(action, int):
+            action = self.decode_action(action)
         try:
             return '{0} {1} {2} {3}'.format(*action)
         except Exception:
@@ -183,32 +316,50 @@ class Board(object):
     def display_action(self, action):
         return self.unpack_action(action)
 
+    def encode_action(self, action):
+        """ Returns the compact action (0 to 80) of an (R, C, r, c) action. """
+        return action_indices[action]
+
+    def decode_action(self, index):
+        """ Returns the (R, C, r, c) action of a compact action. """
+        return index_actions[index]
+
     def next_state(self, state, action):
         R, C, r, c = action
+        return self.next_state_index(state, 9 * (3 * R + C) + 3 * r + c)
+
+    def next_state_index(self, state, index):
+        """ Like next_state, but takes a compact action. """
+        B, cell = divmod(index, 9)
         player = state[-1]
-        board_index = 2 * (3 * R + C)
+        board_index = 2 * B
         player_index = player - 1
 
         state = list(state)
         state[-1] = 3 - player
-        state[board_index + player_index] |= positions[(r, c)]
+        state[board_index + player_index] |= 1 << cell
         updated_board = state[board_index + player_index]
 
-        full = (state[board_index] | state[board_index + 1] == 0x1ff)
-        if any(updated_board & w == w for w in self.wins):
-            state[18 + player_index] |= positions[(R, C)]
-        elif full:
-            state[18] |= positions[(R, C)]
-            state[19] |= positions[(R, C)]
+        if win_table[updated_board]:
+            state[18 + player_index] |= 1 << B
+        elif full_table[state[board_index] | state[board_index + 1]] or (
+                self.close_dead and not winnable_table[state[board_index]]
+                and not winnable_table[state[board_index + 1]]):
+            state[18] |= 1 << B
+            state[19] |= 1 << B
 
-        if (state[18] | state[19]) & positions[(r, c)]:
+        if (state[18] | state[19]) & (1 << cell):
             state[20], state[21] = None, None
         else:
-            state[20], state[21] = r, c
+            state[20], state[21] = divmod(cell, 3)
 
         return tuple(state)
 
     def is_legal(self, state, action):
+        if isinstance(action, int):
+            if not 0 <= action < 81:
+                return False
+            action = self.decode_action(action)
         R, C, r, c = action
 
         # Is action out of bounds?
@@ -239,27 +390,91 @@ class Board(object):
         return (R, C) == (state[20], state[21])
 
     def legal_actions(self, state):
-        R, C = state[20], state[21]
-        Rset, Cset = (R,), (C,)
-        if R is None:
-            Rset, Cset = range(3), range(3)
+        return [index_actions[index] for index in self.legal_indices(state)]
+
+    def legal_indices(self, state):
+        """ Returns the legal compact actions in increasing order, as a tuple. """
+        if state[20] is not None:
+            B = 3 * state[20] + state[21]
+            return board_moves[B][state[2 * B] | state[2 * B + 1]]
 
-        occupied = [
-            state[2 * x] | state[2 * x + 1] for x in range(9)
-        ]
         finished = state[18] | state[19]
+        actions = ()
+        for B in range(9):
+            if not finished & (1 << B):
+                actions += board_moves[B][state[2 * B] | state[2 * B + 1]]
+        return actions
 
-        actions = [
-            (R, C, r, c)
-            for R in Rset
-            for C in Cset
-            for r in range(3)
-            for c in range(3)
-            if not occupied[3 * R + C] & positions[(r, c)]
-            and not finished & positions[(R, C)]
-        ]
+    def informed_index(self, state, rng=random):
+        """ Returns a legal compact action for quick heuristic playouts, using only the 9-bit tables.
 
-        return actions
+        The action wins the game if it can, else wins a sub-board, else blocks a sub-board win of the
+        opponent. Among what is left it avoids sending the opponent to a sub-board they can win at once (or
+        giving them the choice of one), and picks at random.
+        """
+        player = state[22]
+        mine = player - 1
+        finished = state[18] | state[19]
+        if state[20] is None:
+            boards = clear_cells[finished]
+        else:
+            boards = (3 * state[20] + state[21],)
+        game_threats = threat_table[state[18 + mine] & ~state[19 - mine]]
+        wins = ()
+        blocks = ()
+        for B in boards:
+            own = state[2 * B + mine]
+            other = state[2 * B + 1 - mine]
+            clear = ~(own | other) & 0x1ff
+            winning = threat_table[own] & clear
+            if winning:
+                if game_threats & (1 << B):
+                    return rng.choice(board_moves[B][0x1ff ^ winning])
+                wins += board_moves[B][0x1ff ^ winning]
+            elif not wins:
+                blocking = threat_table[other] & clear
+                if blocking:
+                    blocks += board_moves[B][0x1ff ^ blocking]
+        if wins:
+            return rng.choice(wins)
+        actions = blocks or self.legal_indices(state)
+
+        # The sub-boards the opponent could win with their next move; a closed one as destination lets them pick.
+        hot = 0
+        for B in clear_cells[finished]:
+            if threat_table[state[2 * B + 1 - mine]] & ~(state[2 * B] | state[2 * B + 1]):
+                hot |= 1 << B
+        if hot:
+            unsafe = hot | finished
+            safe = [index for index in actions if not unsafe & (1 << index_cells[index])]
+            if safe:
+                return rng.choice(safe)
+        return rng.choice(actions)
+
+    def prior_indices(self, state, actions):
+        """ Returns legal compact actions in the order of a cheap prior, for expanding search trees: moves that win
+        a sub-board, then moves that block a sub-board win of the opponent, then centre squares, then the rest.
+        Each kind of move comes first among the moves that do not let the opponent choose where to play. The
+        order is the same every time for the same state and actions.
+        """
+        mine = state[22] - 1
+        finished = state[18] | state[19]
+        ranks = ([], [], [], [], [], [], [], [])
+        for index in actions:
+            B = index_boards[index]
+            square = 1 << index_cells[index]
+            closed = finished
+            if threat_table[state[2 * B + mine]] & square:
+                kind = 0
+                closed |= 1 << B
+            elif threat_table[state[2 * B + 1 - mine]] & square:
+                kind = 1
+            elif square == 0x10:
+                kind = 2
+            else:
+                kind = 3
+            ranks[2 * kind + ((closed & square) != 0)].append(index)
+        return ranks[0] + ranks[1] + ranks[2] + ranks[3] + ranks[4] + ranks[5] + ranks[6] + ranks[7]
 
     def previous_player(self, state):
         return 3 - state[-1]
@@ -267,31 +482,62 @@ class Board(object):
     def current_player(self, state):
         return state[-1]
 
-    def is_ended(self, state):
+    # Terminal outcomes as returned by outcome(), indexed by player number
+    # like points_values (index 0 is unused).
+    p1_won = (0, 1, -1)
+    p2_won = (0, -1, 1)
+    drawn = (0, 0, 0)
+
+    # Outcome per pair of big-board masks; the outcome depends on nothing else.
+    _outcome_cache = {}
+
+    def outcome(self, state):
+        """ Returns the points of a finished game in one pass, or None while the game is still going.
+
+        The result is one of p1_won, p2_won or drawn, so outcome(state)[player] is the same value as
+        points_values(state)[player]. Results are cached on the big-board masks.
+        """
+        key = state[18] << 9 | state[19]
+        try:
+            return self._outcome_cache[key]
+        except KeyError:
+            pass
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
 
-        if any(w & p1 == w for w in self.wins):
-            return True
-        if any(w & p2 == w for w in self.wins):
-            return True
-        if state[18] | state[19] == 0x1ff:
-            return True
+        if win_table[p1]:
+            result = self.p1_won
+        elif win_table[p2]:
+            result = self.p2_won
+        elif full_table[state[18] | state[19]] or (
+                self.close_dead and not winnable_table[state[18]] and not winnable_table[state[19]]):
+            result = self.drawn
+        else:
+            result = None
+        self._outcome_cache[key] = result
+        return result
+
+    def close_dead_boards(self, fields):
+        """ Closes the dead sub-boards of a fields list in place, as close_dead does for each move, e.g. for a
+        state reached under the standard rules. """
+        finished = fields[18] | fields[19]
+        for B in clear_cells[finished]:
+            if not winnable_table[fields[2 * B]] and not winnable_table[fields[2 * B + 1]]:
+                fields[18] |= 1 << B
+                fields[19] |= 1 << B
+        if fields[20] is not None and (fields[18] | fields[19]) & (1 << (3 * fields[20] + fields[21])):
+            fields[20] = fields[21] = None
 
-        return False
+    def is_ended(self, state):
+        return self.outcome(state) is not None
 
     def win_values(self, state):
-        if not self.is_ended(state):
+        result = self.outcome(state)
+        if result is None:
             return
-        p1 = state[18] & ~state[19]
-        p2 = state[19] & ~state[18]
-
-        if any(w & p1 == w for w in self.wins):
-            return {1: 1, 2: 0}
-        if any(w & p2 == w for w in self.wins):
-            return {1: 0, 2: 1}
-        if state[18] | state[19] == 0x1ff:
+        if result is self.drawn:
             return {1: 0.5, 2: 0.5}
+        return {1: int(result[1] > 0), 2: int(result[2] > 0)}
 
     def owned_boxes(self, state):
         p1 = state[18] & ~state[19]
@@ -307,18 +553,91 @@ class Board(object):
                     ret[(y,x)] = 0
         return ret
         
-    def points_values(self, state):
-        if not self.is_ended(state):
-            return
+    def evaluate(self, state):
+        """ Returns a quick estimate of the points of player 1 in an unfinished game, from -1 to 1: the weighted
+        differences in sub-boards owned and in big-board lines that need one more sub-board, and whether the player
+        to move can win a sub-board where they must play. """
+        finished = state[18] | state[19]
         p1 = state[18] & ~state[19]
         p2 = state[19] & ~state[18]
+        score = (eval_owned * (bit_counts[p1] - bit_counts[p2]) +
+                 eval_threats * (bit_counts[threat_table[p1] & ~finished] - bit_counts[threat_table[p2] & ~finished]))
+        mine = state[22] - 1
+        if state[20] is None:
+            boards = clear_cells[finished]
+        else:
+            boards = (3 * state[20] + state[21],)
+        for B in boards:
+            if threat_table[state[2 * B + mine]] & ~(state[2 * B] | state[2 * B + 1]):
+                score += -eval_mover if mine else eval_mover
+                break
+        return max(-1., min(1., score))
 
-        if any(w & p1 == w for w in self.wins):
-            return {1: 1, 2: -1}
-        if any(w & p2 == w for w in self.wins):
-            return {1: -1, 2: 1}
-        if state[18] | state[19] == 0x1ff:
-            return {1: 0, 2: 0}
+    def points_values(self, state):
+        result = self.outcome(state)
+        if result is None:
+            return
+        return {1: result[1], 2: result[2]}
+
+    def hash_state(self, state):
+        """ Returns the Zobrist hash of a state, the same value that a HashedState keeps up to date. """
+        if state[20] is None:
+            state_hash = zobrist_constraints[9]
+        else:
+            state_hash = zobrist_constraints[3 * state[20] + state[21]]
+        for B in range(9):
+            for player in (1, 2):
+                for index in board_moves[B][~state[2 * B + player - 1] & 0x1ff]:
+                    state_hash ^= zobrist_pieces[player][index]
+        return state_hash
+
+    def transform_state(self, state, symmetry):
+        """ Returns the state with one of the 8 symmetries (0 is the identity) applied. """
+        cells = symmetry_cells[symmetry]
+        masks = symmetry_masks[symmetry]
+        transformed = [0] * 18
+        for B in range(9):
+            transformed[2 * cells[B]] = masks[state[2 * B]]
+            transformed[2 * cells[B] + 1] = masks[state[2 * B + 1]]
+        transformed.extend([masks[state[18]], masks[state[19]]])
+        if state[20] is None:
+            transformed.extend([None, None])
+        else:
+            transformed.extend(divmod(cells[3 * state[20] + state[21]], 3))
+        transformed.append(state[22])
+        return tuple(transformed)
+
+    def symmetric_hashes(self, state):
+        """ Returns the Zobrist hashes of the 8 symmetries of a state, in the order of symmetry_cells. """
+        hashes = []
+        for symmetry in range(8):
+            pieces = zobrist_symmetric_pieces[symmetry]
+            state_hash = zobrist_symmetric_constraints[symmetry][constraint_index(state)]
+            for B in range(9):
+                for player in (1, 2):
+                    for index in board_moves[B][~state[2 * B + player - 1] & 0x1ff]:
+                        state_hash ^= pieces[player][index]
+            hashes.append(state_hash)
+        return hashes
+
+    def canonical_state(self, state):
+        """ Returns the symmetry of the state with the smallest hash and the number of the symmetry used, so that
+        all 8 symmetric states give the same canonical state. """
+        hashes = self.symmetric_hashes(state)
+        symmetry = hashes.index(min(hashes))
+        return self.transform_state(state, symmetry), symmetry
+
+    def mutable_state(self, state):
+        """ Returns a MutableState starting from the given state. """
+        return MutableState(self, state)
+
+    def hashed_state(self, state, state_hash=None):
+        """ Returns a HashedState starting from the given state. """
+        return HashedState(self, state, state_hash)
+
+    def symmetric_state(self, state, hashes=None):
+        """ Returns a SymmetricState starting from the given state. """
+        return SymmetricState(self, state, hashes)
 
     def winner_message(self, winners):
         winners = sorted((v, k) for k, v in winners.items())
@@ -326,3 +645,199 @@ class Board(object):
         if value == 0.5:
             return "Draw."
         return "Winner: Player {0}.".format(winner)
+
+
+class MutableState(object):
+    """ A game state that is changed in place by apply() and undo() instead of building a new tuple per ply.
+
+    The fields list has the same layout as a state tuple, so Board methods that only read a state accept it
+    directly. Each apply() records what undo() needs in a flat list of ints, so playing and taking back moves
+    does not allocate once the list has grown.
+    """
+    __slots__ = ('board', 'fields', 'history')
+
+    def __init__(self, board, state):
+        self.board = board
+        self.fields = list(state)
+        self.history = []
+
+    def load(self, state):
+        """ Resets to the given state tuple and forgets the history. """
+        self.fields[:] = state
+        del self.history[:]
+
+    def freeze(self):
+        """ Returns the current state as a hashable tuple. """
+        return tuple(self.fields)
+
+    def apply(self, index):
+        """ Plays a compact action. """
+        fields = self.fields
+        history = self.history
+        B = index_boards[index]
+        cell = index_cells[index]
+        player = fields[22]
+        board_index = 2 * B
+
+        history.append(index)
+        history.append(fields[18])
+        history.append(fields[19])
+        history.append(fields[20])
+        history.append(fields[21])
+
+        fields[22] = 3 - player
+        updated_board = fields[board_index + player - 1] | (1 << cell)
+        fields[board_index + player - 1] = updated_board
+
+        if win_table[updated_board]:
+            fields[17 + player] |= 1 << B
+        elif full_table[fields[board_index] | fields[board_index + 1]] or (
+                self.board.close_dead and not winnable_table[fields[board_index]]
+                and not winnable_table[fields[board_index + 1]]):
+            fields[18] |= 1 << B
+            fields[19] |= 1 << B
+
+        if (fields[18] | fields[19]) & (1 << cell):
+            fields[20] = fields[21] = None
+        else:
+            fields[20] = cell_rows[cell]
+            fields[21] = cell_cols[cell]
+
+    def undo(self):
+        """ Takes back the last applied action. """
+        fields = self.fields
+        history = self.history
+        fields[21] = history.pop()
+        fields[20] = history.pop()
+        fields[19] = history.pop()
+        fields[18] = history.pop()
+        index = history.pop()
+        player = 3 - fields[22]
+        fields[22] = player
+        fields[2 * index_boards[index] + player - 1] &= ~(1 << index_cells[index])
+
+    def rewind(self):
+        """ Takes back every action applied since the state was created or loaded. """
+        while self.history:
+            self.undo()
+
+    def plies(self):
+        """ Returns the number of actions that undo() can take back. """
+        return len(self.history) // 5
+
+    def current_player(self):
+        return self.fields[22]
+
+    def outcome(self):
+        return self.board.outcome(self.fields)
+
+    def legal_indices(self):
+        return self.board.legal_indices(self.fields)
+
+    def informed_index(self, rng=random):
+        return self.board.informed_index(self.fields, rng)
+
+    def distinct_indices(self):
+        """ Returns the legal actions that lead to different positions. A plain state does not look at
+        symmetries, so these are all the legal actions. """
+        return self.board.legal_indices(self.fields)
+
+
+def constraint_index(state):
+    """ Returns the sub-board that the next action must be played in, or 9 if any is allowed. """
+    if state[20] is None:
+        return 9
+    return 3 * state[20] + state[21]
+
+
+class HashedState(MutableState):
+    """ A MutableState that also keeps the Zobrist hash of its state up to date in hash.
+
+    The hash is updated incrementally by apply() and undo(). It costs about a quarter of a plain apply(), so
+    rollouts that do not need it should use a plain MutableState.
+    """
+    __slots__ = ('hash', 'hashes')
+
+    def __init__(self, board, state, state_hash=None):
+        MutableState.__init__(self, board, state)
+        self.hashes = []
+        self.hash = board.hash_state(state) if state_hash is None else state_hash
+
+    def load(self, state, state_hash=None):
+        """ Resets to the given state tuple and forgets the history. Pass the state's hash if it is known. """
+        MutableState.load(self, state)
+        del self.hashes[:]
+        self.hash = self.board.hash_state(state) if state_hash is None else state_hash
+
+    def apply(self, index):
+        fields = self.fields
+        state_hash = self.hash ^ zobrist_pieces[fields[22]][index] ^ zobrist_constraints[constraint_index(fields)]
+        self.hashes.append(self.hash)
+        MutableState.apply(self, index)
+        self.hash = state_hash ^ zobrist_constraints[constraint_index(fields)]
+
+    def undo(self):
+        MutableState.undo(self)
+        self.hash = self.hashes.pop()
+
+    def position_key(self):
+        """ Returns the key of the position for a transposition table. """
+        return self.hash
+
+
+class SymmetricState(MutableState):
+    """ A MutableState that keeps the Zobrist hashes of all 8 symmetries of its state up to date, so that
+    symmetric positions can be recognised as one.
+
+    hash is the hash of the state itself, as in HashedState; hashes holds the hash of each symmetry.
+    """
+    __slots__ = ('hash', 'hashes', 'hash_history')
+
+    def __init__(self, board, state, hashes=None):
+        MutableState.__init__(self, board, state)
+        self.hash_history = []
+        self.hashes = board.symmetric_hashes(state) if hashes is None else list(hashes)
+        self.hash = self.hashes[0]
+
+    def load(self, state, hashes=None):
+        """ Resets to the given state tuple and forgets the history. Pass the state's hashes if they are known. """
+        MutableState.load(self, state)
+        del self.hash_history[:]
+        self.hashes = self.board.symmetric_hashes(state) if hashes is None else list(hashes)
+        self.hash = self.hashes[0]
+
+    def apply(self, index):
+        fields = self.fields
+        player = fields[22]
+        before = constraint_index(fields)
+        self.hash_history.append(self.hashes)
+        MutableState.apply(self, index)
+        after = constraint_index(fields)
+        self.hashes = [
+            state_hash ^ pieces[player][index] ^ constraints[before] ^ constraints[after]
+            for state_hash, pieces, constraints in zip(
+                self.hashes, zobrist_symmetric_pieces, zobrist_symmetric_constraints)
+        ]
+        self.hash = self.hashes[0]
+
+    def undo(self):
+        MutableState.undo(self)
+        self.hashes = self.hash_history.pop()
+        self.hash = self.hashes[0]
+
+    def position_key(self):
+        """ Returns the key of the position for a transposition table, the same for all 8 symmetries. """
+        return min(self.hashes)
+
+    def distinct_indices(self):
+        """ Returns the legal actions that lead to different positions: of the actions that a symmetry
+        leaving the current state unchanged maps onto each other, only the smallest is kept. """
+        actions = self.board.legal_indices(self.fields)
+        hashes = self.hashes
+        stabilizer = [symmetry_actions[k] for k in range(1, 8) if hashes[k] == hashes[0]]
+        if not stabilizer:
+            return actions
+        return tuple(
+            index for index in actions
+            if all(index <= mapping[index] for mapping in stabilizer)
+        )
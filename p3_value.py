@@ -0,0 +1,143 @@
+import sys
+import random
+import numpy as np
+import p3_t3
+
+# Feature vectors: the 9 bits of each of the 20 bitboard fields (the 18 sub-board masks, then the 2 big-board
+# masks), a one-hot of the required sub-board (the last of 10 for any) and 1 if player 1 is to move.
+feature_count = 20 * 9 + 10 + 1
+shifts = np.arange(9, dtype=np.int32)
+
+
+def features(states):
+    """ Returns the feature vectors of a sequence of state tuples (or MutableState fields lists), as an
+    (N, feature_count) float array. """
+    rows = np.array([tuple(state[:20]) + (p3_t3.constraint_index(state), state[22]) for state in states],
+                    dtype=np.int32).reshape(-1, 22)
+    n = len(rows)
+    result = np.zeros((n, feature_count))
+    result[:, :180] = ((rows[:, :20, None] >> shifts) & 1).reshape(n, 180)
+    result[np.arange(n), 180 + rows[:, 20]] = 1.
+    result[:, -1] = rows[:, 21] == 1
+    return result
+
+
+class ValueFunction(object):
+    """ A fully connected network from the features of a state to an estimate of the points of player 1, from -1
+    to 1. Hidden layers use tanh, and so does the output. With no hidden layers it is a linear model (squashed by
+    the output tanh).
+
+    layers is a list of (weights, biases) pairs, weights being an (inputs, outputs) array.
+    """
+
+    def __init__(self, hidden=(), rng=None):
+        """ Creates a network with the given sizes of hidden layers and small random weights. """
+        rng = np.random.default_rng() if rng is None else rng
+        sizes = (feature_count,) + tuple(hidden) + (1,)
+        self.layers = [(rng.normal(0., 1. / np.sqrt(inputs), (inputs, outputs)), np.zeros(outputs))
+                       for inputs, outputs in zip(sizes[:-1], sizes[1:])]
+
+    @classmethod
+    def load(cls, path):
+        """ Reads a network written by save. """
+        data = np.load(path)
+        network = cls.__new__(cls)
+        network.layers = [(data['weights%d' % layer], data['biases%d' % layer])
+                          for layer in range(len(data.files) // 2)]
+        return network
+
+    def save(self, path):
+        """ Writes the weights to an .npz file. """
+        arrays = {}
+        for layer, (weights, biases) in enumerate(self.layers):
+            arrays['weights%d' % layer] = weights
+            arrays['biases%d' % layer] = biases
+        np.savez(path, **arrays)
+
+    def forward(self, inputs):
+        """ Returns the activations of every layer for an (N, feature_count) array, the inputs first. """
+        activations = [inputs]
+        for weights, biases in self.layers:
+            activations.append(np.tanh(activations[-1] @ weights + biases))
+        return activations
+
+    def evaluate(self, states):
+        """ Returns the estimated points of player 1 of each of a sequence of states, as an (N,) array. """
+        return self.forward(features(states))[-1][:, 0]
+
+    def train(self, inputs, targets, epochs=10, learning_rate=0.05, batch_size=256, rng=None):
+        """ Fits the network to targets by minibatch gradient descent on the mean squared error.
+
+        Args:
+            inputs:         An (N, feature_count) array of features.
+            targets:        The N values to learn, e.g. the points of player 1 at the end of each game.
+            epochs:         The number of passes over the data.
+            learning_rate:  The step size.
+            batch_size:     The number of examples per step.
+            rng:            A numpy Generator for shuffling.
+
+        Returns:    The mean squared error over each epoch.
+
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        targets = np.asarray(targets, dtype=float).reshape(-1, 1)
+        losses = []
+        for _ in range(epochs):
+            order = rng.permutation(len(inputs))
+            total = 0.
+            for first in range(0, len(order), batch_size):
+                batch = order[first:first + batch_size]
+                activations = self.forward(inputs[batch])
+                error = activations[-1] - targets[batch]
+                total += float((error ** 2).sum())
+                # back through each tanh: d tanh(z) / dz = 1 - tanh(z)**2
+                delta = 2. * error * (1. - activations[-1] ** 2) / len(batch)
+                for layer in range(len(self.layers) - 1, -1, -1):
+                    weights, biases = self.layers[layer]
+                    below = activations[layer]
+                    weight_gradient = below.T @ delta
+                    bias_gradient = delta.sum(axis=0)
+                    if layer:
+                        delta = (delta @ weights.T) * (1. - below ** 2)
+                    self.layers[layer] = (weights - learning_rate * weight_gradient,
+                                          biases - learning_rate * bias_gradient)
+            losses.append(total / len(order))
+        return losses
+
+
+def random_game_examples(games, every=3, rng=None):
+    """ Plays uniformly random games and returns the features of every every-th position before the end of each,
+    with the points of player 1 at its end: the result of a random rollout, as the targets of train.
+
+    Returns:    An (N, feature_count) array of features and the N targets.
+
+    """
+    rng = random.Random() if rng is None else rng
+    board = p3_t3.Board()
+    game = board.mutable_state(board.starting_state())
+    states = []
+    targets = []
+    for _ in range(games):
+        game.load(board.starting_state())
+        positions = []
+        while game.outcome() is None:
+            if game.plies() % every == 0:
+                positions.append(game.freeze())
+            game.apply(rng.choice(game.legal_indices()))
+        states += positions
+        targets += [game.outcome()[1]] * len(positions)
+    return features(states), np.array(targets, dtype=float)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Need a weights file to write, then optionally the number of training games and hidden layer sizes")
+        exit(1)
+    games = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    hidden = tuple(int(size) for size in sys.argv[3:])
+    rng = np.random.default_rng(146)
+    inputs, targets = random_game_examples(games, rng=random.Random(146))
+    network = ValueFunction(hidden, rng)
+    for epoch, loss in enumerate(network.train(inputs, targets, rng=rng)):
+        print("epoch %d: mean squared error %.4f" % (epoch + 1, loss))
+    network.save(sys.argv[1])
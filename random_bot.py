@@ -2,4 +2,4 @@ from random import choice
 
 def think(board, state):
     """ Returns a random move. """
-    return choice(board.legal_actions(state))
+    return board.decode_action(choice(board.legal_indices(state)))
@@ -1,7 +1,38 @@
 import random
 
+try:
+    import p3_batch
+except ImportError:  # numpy is optional; only the 'numpy' rollout backend needs it
+    p3_batch = None
+
 ROLLOUTS = 10
 MAX_DEPTH = 5
+# 'python' plays the rollouts one at a time; 'numpy' plays all of them at once with p3_batch.
+ROLLOUT_BACKEND = 'python'
+# 'random' plays uniformly random moves; 'informed' plays the quick win-now / block-now moves of
+# Board.informed_index (python backend only).
+ROLLOUT_POLICY = 'random'
+
+
+def batch_expectations(board, state, moves):
+    """ Plays ROLLOUTS random games to depth MAX_DEPTH after each move, all in lockstep with p3_batch, and
+    scores them the same way as think.
+
+    Returns:    The average score of each move for the player to move.
+
+    """
+    if p3_batch is None:
+        raise ImportError("the 'numpy' rollout backend needs numpy")
+    if ROLLOUT_POLICY != 'random':
+        raise ValueError("the 'numpy' rollout backend only plays random rollouts")
+    starts = [board.next_state_index(state, move) for move in moves for r in range(ROLLOUTS)]
+    games = p3_batch.batch_rollouts(starts, max_plies=MAX_DEPTH)
+    red_score = games.points * 9
+    blue_score = -red_score
+    red_score[~games.finished] = games.owned(1)[~games.finished]
+    blue_score[~games.finished] = games.owned(2)[~games.finished]
+    score = red_score - blue_score if board.current_player(state) == 1 else blue_score - red_score
+    return score.reshape(len(moves), ROLLOUTS).mean(axis=1).tolist()
 
 
 def think(board, state):
@@ -15,7 +46,7 @@ def think(board, state):
     Returns:    The action with the maximal score given the rollouts.
 
     """
-    moves = board.legal_actions(state)
+    moves = board.legal_indices(state)
 
     best_move = moves[0]
     best_expectation = float('-inf')
@@ -33,29 +64,44 @@ def think(board, state):
             blue_score = len([v for v in owned_boxes.values() if v == 2])
         return red_score - blue_score if me == 1 else blue_score - red_score
 
-    for move in moves:
-        total_score = 0.0
+    if ROLLOUT_BACKEND == 'numpy':
+        expectations = batch_expectations(board, state, moves)
+    else:
+        expectations = []
+
+        # Every rollout is played on this one game and then undone.
+        rollout_state = board.mutable_state(state)
+        informed = ROLLOUT_POLICY == 'informed'
+
+        for move in moves:
+            total_score = 0.0
 
-        # Sample a set number of games where the target move is immediately applied.
-        for r in range(ROLLOUTS):
-            rollout_state = board.next_state(state, move)
+            # Sample a set number of games where the target move is immediately applied.
+            for r in range(ROLLOUTS):
+                rollout_state.apply(move)
 
-            # Only play to the specified depth.
-            for i in range(MAX_DEPTH):
-                if board.is_ended(rollout_state):
-                    break
-                rollout_move = random.choice(board.legal_actions(rollout_state))
-                rollout_state = board.next_state(rollout_state, rollout_move)
+                # Only play to the specified depth.
+                game_points = rollout_state.outcome()
+                for i in range(MAX_DEPTH):
+                    if game_points is not None:
+                        break
+                    if informed:
+                        rollout_state.apply(rollout_state.informed_index())
+                    else:
+                        rollout_state.apply(random.choice(rollout_state.legal_indices()))
+                    game_points = rollout_state.outcome()
 
-            total_score += outcome(board.owned_boxes(rollout_state),
-                                   board.points_values(rollout_state))
+                total_score += outcome(board.owned_boxes(rollout_state.fields), game_points)
+                rollout_state.rewind()
 
-        expectation = float(total_score) / ROLLOUTS
+            expectations.append(float(total_score) / ROLLOUTS)
 
+    for move, expectation in zip(moves, expectations):
         # If the current move has a better average score, replace best_move and best_expectation
         if expectation > best_expectation:
             best_expectation = expectation
             best_move = move
 
+    best_move = board.decode_action(best_move)
     print("Rollout bot picking %s with expected score %f" % (str(best_move), best_expectation))
     return best_move